@@ -0,0 +1,68 @@
+"""
+Admission control: ограничивает число одновременно обрабатываемых запросов
+в процессе, чтобы очередь копилась не в пуле соединений БД (где запрос
+ждёт до pool_timeout), а здесь - с быстрым отказом 503.
+"""
+import asyncio
+import json
+from typing import Iterable
+
+# Счётчики для /metrics
+stats = {"in_flight": 0, "queued": 0, "shed_total": 0}
+
+
+class ConcurrencyLimitMiddleware:
+    def __init__(
+        self,
+        app,
+        limit: int,
+        max_queue: int = 100,
+        queue_timeout_ms: float = 500,
+        exempt_paths: Iterable[str] = ("/health", "/metrics"),
+    ):
+        self.app = app
+        self.semaphore = asyncio.Semaphore(limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout_ms / 1000
+        self.exempt_paths = set(exempt_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        if self.semaphore.locked():
+            if stats["queued"] >= self.max_queue:
+                await self._reject(send)
+                return
+            stats["queued"] += 1
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                await self._reject(send)
+                return
+            finally:
+                stats["queued"] -= 1
+        else:
+            await self.semaphore.acquire()
+
+        stats["in_flight"] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            stats["in_flight"] -= 1
+            self.semaphore.release()
+
+    async def _reject(self, send):
+        stats["shed_total"] += 1
+        body = json.dumps({"detail": "Server is busy, retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", b"1"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
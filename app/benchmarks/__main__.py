@@ -0,0 +1,94 @@
+"""
+Запуск: python -m benchmarks [--db-url ... --redis-url ... --i-understand-this-drops-data]
+        [--save-baseline] [--compare] [--only notes_create,note_read_hit]
+
+По умолчанию SQLite-файл во временной папке и fakeredis. Внешние БД и Redis
+бенчмарк очищает (схема public пересоздаётся миграциями, FLUSHDB) - указывайте
+отдельную базу, а не рабочую.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+from benchmarks.harness import find_regressions, format_table, load_baseline, run_scenario, save_baseline
+from benchmarks.scenarios import BenchEnv, build_scenarios
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Notes API benchmarks")
+    parser.add_argument("--db-url", help="SQLAlchemy async URL, по умолчанию SQLite")
+    parser.add_argument("--redis-url", help="URL Redis, по умолчанию fakeredis")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--only", help="список сценариев через запятую")
+    parser.add_argument("--profile", help="имя baseline файла, по умолчанию <db>-<redis>")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="сравнить с baseline, exit 1 при регрессии")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument(
+        "--i-understand-this-drops-data", dest="drop_data", action="store_true",
+        help="разрешить очистку базы из --db-url и Redis из --redis-url",
+    )
+    args = parser.parse_args(argv)
+    if (args.db_url or args.redis_url) and not args.drop_data:
+        parser.error("--db-url/--redis-url are wiped before the run, pass --i-understand-this-drops-data")
+    return args
+
+
+async def main(args) -> int:
+    tmpdir = None
+    db_url = args.db_url
+    if not db_url:
+        tmpdir = tempfile.mkdtemp(prefix="notes-bench-")
+        db_url = f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+    profile = args.profile or "{}-{}".format(
+        "postgres" if db_url.startswith("postgresql") else "sqlite",
+        "redis" if args.redis_url else "fakeredis",
+    )
+    baseline_path = os.path.join(BASELINE_DIR, f"{profile}.json")
+
+    env = BenchEnv(db_url, args.redis_url)
+    await env.start()
+    try:
+        only = set(args.only.split(",")) if args.only else None
+        results = []
+        for scenario in build_scenarios(env):
+            if only and scenario.name not in only:
+                continue
+            results.append(await run_scenario(
+                scenario.name,
+                scenario.op,
+                requests=scenario.requests or args.requests,
+                concurrency=args.concurrency,
+                prepare=scenario.prepare,
+                warmup=args.warmup,
+            ))
+    finally:
+        await env.stop()
+
+    print(f"profile: {profile}")
+    print(format_table(results))
+
+    if args.save_baseline:
+        save_baseline(results, baseline_path)
+        print(f"baseline saved: {baseline_path}")
+
+    if args.compare:
+        if not os.path.exists(baseline_path):
+            print(f"no baseline at {baseline_path}")
+            return 1
+        problems = find_regressions(results, load_baseline(baseline_path), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
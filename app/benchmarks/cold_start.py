@@ -0,0 +1,67 @@
+"""
+Время холодного старта: запуск интерпретатора, import main (create_app)
+и lifespan startup до готовности. Каждый прогон - отдельный процесс.
+
+Запуск: python -m benchmarks.cold_start [--runs 10] [--db-url ...] [--json out.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.harness import percentile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import asyncio, json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+async def startup():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+t2 = asyncio.run(startup())
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "startup_ms": (t2 - t1) * 1000}))
+"""
+
+
+def run_once(env: dict) -> dict:
+    started = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=APP_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["total_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--db-url", help="по умолчанию SQLite во временной папке")
+    parser.add_argument("--json", help="сохранить результат в файл")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env.setdefault("LOG_LEVEL", "WARNING")
+    env["DATABASE_URL"] = args.db_url or "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "cold.db")
+
+    runs = [run_once(env) for _ in range(args.runs)]
+    summary = {}
+    for metric in ("import_ms", "startup_ms", "total_ms"):
+        values = sorted(r[metric] for r in runs)
+        summary[metric] = {"p50": round(percentile(values, 50), 1), "max": round(values[-1], 1)}
+        print(f"{metric:<12} p50 {summary[metric]['p50']:>8.1f} ms   max {summary[metric]['max']:>8.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Измерение latency/throughput сценариев, хранение baseline в JSON и
+поиск регрессий. Модуль не зависит от приложения.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+@dataclass
+class BenchResult:
+    name: str
+    requests: int
+    concurrency: int
+    errors: int
+    duration_s: float
+    throughput: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    extra: Dict[str, float] = field(default_factory=dict)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Перцентиль по методу nearest-rank, значения должны быть отсортированы"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(name: str, latencies: List[float], duration_s: float, concurrency: int, errors: int = 0) -> BenchResult:
+    values = sorted(latencies)
+    total = len(values) + errors
+    return BenchResult(
+        name=name,
+        requests=total,
+        concurrency=concurrency,
+        errors=errors,
+        duration_s=round(duration_s, 4),
+        throughput=round(total / duration_s, 2) if duration_s > 0 else 0.0,
+        p50_ms=round(percentile(values, 50) * 1000, 3),
+        p95_ms=round(percentile(values, 95) * 1000, 3),
+        p99_ms=round(percentile(values, 99) * 1000, 3),
+    )
+
+
+async def run_scenario(
+    name: str,
+    op: Callable[[int], Awaitable[object]],
+    requests: int,
+    concurrency: int = 1,
+    prepare: Optional[Callable[[int], Awaitable[object]]] = None,
+    warmup: int = 0,
+) -> BenchResult:
+    """
+    Выполняет op(i) requests раз в concurrency параллельных воркерах.
+    prepare(i) вызывается перед op(i) и в замер не входит.
+    """
+    for i in range(warmup):
+        if prepare:
+            await prepare(i)
+        await op(i)
+
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            if prepare:
+                await prepare(i)
+            started = time.perf_counter()
+            try:
+                await op(i)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, latencies, time.perf_counter() - started, concurrency, errors)
+
+
+def save_baseline(results: List[BenchResult], path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({r.name: asdict(r) for r in results}, f, indent=2, ensure_ascii=False)
+
+
+def load_baseline(path: str) -> Dict[str, dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def find_regressions(results: List[BenchResult], baseline: Dict[str, dict], tolerance: float = 0.15) -> List[str]:
+    """
+    Регрессия - p95 вырос или throughput упал больше чем на tolerance
+    относительно baseline. Сценарии без baseline пропускаются.
+    """
+    problems = []
+    for r in results:
+        base = baseline.get(r.name)
+        if not base:
+            continue
+        if base["p95_ms"] > 0 and r.p95_ms > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{r.name}: p95 {base['p95_ms']}ms -> {r.p95_ms}ms")
+        if base["throughput"] > 0 and r.throughput < base["throughput"] * (1 - tolerance):
+            problems.append(f"{r.name}: throughput {base['throughput']}/s -> {r.throughput}/s")
+        if r.errors > base.get("errors", 0):
+            problems.append(f"{r.name}: errors {base.get('errors', 0)} -> {r.errors}")
+    return problems
+
+
+def format_table(results: List[BenchResult]) -> str:
+    header = f"{'scenario':<28}{'req':>7}{'err':>5}{'req/s':>11}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r.name:<28}{r.requests:>7}{r.errors:>5}{r.throughput:>11.1f}{r.p50_ms:>10.2f}{r.p95_ms:>10.2f}{r.p99_ms:>10.2f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,277 @@
+"""
+Окружение бенчмарка: роутеры заметок и задач поверх SQLite/Postgres и
+fakeredis/Redis, запросы идут через ASGI-транспорт httpx без сети.
+
+Postgres получает рабочую схему из migrations/ (партиции, триггеры NOTIFY),
+а не create_all; база и Redis перед прогоном очищаются.
+"""
+import itertools
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Лимиты не должны срабатывать под нагрузкой бенчмарка, но их проверка остаётся в пути запроса
+for _name in ("NOTES_READ_PER_USER", "NOTES_WRITE_PER_USER", "TASKS_PER_IP", "TASKS_PER_ROUTE"):
+    os.environ.setdefault(f"RATE_LIMIT_{_name}", "1000000/1")
+
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+
+import httpx
+from fastapi import Depends, FastAPI
+from jose import jwt
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import crud
+import database
+import dependencies
+import jwt_utils
+import migrate
+import rate_limit
+import redis_client
+from cache_keys import user_notes_index_key
+from cache_middleware import CacheMiddleware
+from celery_app import celery_app
+from models import Note, NoteStats, User
+from schemas.note import NoteCreate
+from routers import notes as notes_router
+from routers import tasks as tasks_router
+from routers import users as users_router
+
+SEED_NOTES = 500
+SEARCH_WORDS = ["alpha", "beta", "gamma", "delta"]
+
+
+class Scenario(NamedTuple):
+    name: str
+    op: Callable[[int], Awaitable[object]]
+    prepare: Optional[Callable[[int], Awaitable[object]]] = None
+    requests: Optional[int] = None  # своё число запросов для дорогих сценариев
+
+
+class BenchEnv:
+    def __init__(self, db_url: str, redis_url: Optional[str]):
+        self.db_url = db_url
+        self.redis_url = redis_url
+        self.engine = None
+        self.session_factory = None
+        self.redis = None
+        self.binary_redis = None
+        self.cache_manager = None
+        self.token = None
+        self.user_id: Optional[int] = None
+        self.note_ids: List[int] = []
+        self.client: Optional[httpx.AsyncClient] = None
+        self.cached_client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        self.engine = create_async_engine(self.db_url)
+        self.session_factory = sessionmaker(bind=self.engine, class_=AsyncSession, expire_on_commit=False)
+        await self._reset_database()
+
+        if self.redis_url:
+            import redis.asyncio as redis
+            self.redis = redis.Redis.from_url(self.redis_url, decode_responses=True)
+            self.binary_redis = redis.Redis.from_url(self.redis_url)
+        else:
+            import fakeredis
+            server = fakeredis.FakeServer()
+            self.redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+            self.binary_redis = fakeredis.aioredis.FakeRedis(server=server)
+        await self.redis.flushdb()
+        self.cache_manager = redis_client.CacheManager(self.redis, self.binary_redis)
+        # CacheMiddleware берёт глобальный менеджер напрямую, а не через Depends
+        redis_client.cache_manager = self.cache_manager
+
+        # Брокер в памяти: меряем только стоимость постановки задачи
+        celery_app.conf.broker_url = "memory://"
+        celery_app.conf.result_backend = "cache+memory://"
+
+        await self._seed()
+        self.token = jwt_utils.create_access_token({"sub": "bench"})
+        self.client = self._client(self._build_app(with_cache_middleware=False))
+        self.cached_client = self._client(self._build_app(with_cache_middleware=True))
+
+    async def _reset_database(self):
+        if self.engine.dialect.name != "postgresql":
+            async with self.engine.begin() as conn:
+                await conn.run_sync(database.Base.metadata.drop_all)
+                await conn.run_sync(database.Base.metadata.create_all)
+            return
+        async with self.engine.begin() as conn:
+            await conn.execute(text("DROP SCHEMA public CASCADE"))
+            await conn.execute(text("CREATE SCHEMA public"))
+        await migrate.migrate(url=self.db_url)
+
+    async def stop(self):
+        await self.client.aclose()
+        await self.cached_client.aclose()
+        await self.redis.aclose()
+        await self.binary_redis.aclose()
+        await self.engine.dispose()
+
+    async def _seed(self):
+        async with self.session_factory() as session:
+            user = User(username="bench", password="x", role="user")
+            session.add(user)
+            await session.flush()
+            self.user_id = user.id
+            notes = [
+                Note(text=f"note {i} {SEARCH_WORDS[i % len(SEARCH_WORDS)]}", owner_id=user.id)
+                for i in range(SEED_NOTES)
+            ]
+            session.add_all(notes)
+            session.add(NoteStats(owner_id=user.id, note_count=SEED_NOTES))
+            await session.commit()
+            self.note_ids = [n.id for n in notes]
+
+    async def _get_db(self):
+        async with self.session_factory() as session:
+            yield session
+
+    async def _get_cache_manager(self):
+        return self.cache_manager
+
+    def _build_app(self, with_cache_middleware: bool) -> FastAPI:
+        app = FastAPI()
+        app.include_router(notes_router.router)
+        app.include_router(tasks_router.router)
+        app.include_router(users_router.router)
+
+        @app.get("/bench/ping")
+        async def ping():
+            return {"ok": True}
+
+        @app.get("/bench/whoami")
+        async def whoami(current_user: User = Depends(dependencies.get_current_user)):
+            return {"id": current_user.id}
+
+        app.dependency_overrides[database.get_db] = self._get_db
+        app.dependency_overrides[dependencies.get_db] = self._get_db
+        app.dependency_overrides[redis_client.get_cache_manager] = self._get_cache_manager
+        if with_cache_middleware:
+            app.add_middleware(CacheMiddleware, cache_routes=["/notes"])
+        return app
+
+    def _client(self, app: FastAPI) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://bench",
+            headers={"Authorization": f"Bearer {self.token}"},
+        )
+
+
+def _check(response: httpx.Response) -> httpx.Response:
+    response.raise_for_status()
+    return response
+
+
+def build_scenarios(env: BenchEnv) -> List[Scenario]:
+    client = env.client
+    ids = env.note_ids
+    deletable: List[int] = []
+
+    async def create(i):
+        _check(await client.post("/notes/", json={"text": f"bench note {i}"}))
+
+    async def seed_deletable(i):
+        # Своя заметка на каждый запрос: сценарий не зависит от notes_create (--only notes_delete)
+        async with env.session_factory() as session:
+            note = await crud.create_note(NoteCreate(text=f"to delete {i}"), env.user_id, session)
+        deletable.append(note.id)
+
+    async def drop_note_key(i):
+        await env.redis.delete(f"note:{ids[i % len(ids)]}:user:{env.user_id}")
+
+    async def read_note(i):
+        _check(await client.get(f"/notes/{ids[i % len(ids)]}"))
+
+    async def read_hot_note(i):
+        _check(await client.get(f"/notes/{ids[0]}"))
+
+    etags = {}
+
+    async def read_not_modified(i):
+        if "note" not in etags:
+            etags["note"] = _check(await client.get(f"/notes/{ids[1]}")).headers["etag"]
+        r = await client.get(f"/notes/{ids[1]}", headers={"If-None-Match": etags["note"]})
+        assert r.status_code == 304
+
+    async def drop_list_keys(i):
+        await env.cache_manager.delete_index(user_notes_index_key(env.user_id))
+
+    async def list_page(i):
+        _check(await client.get("/notes/", params={"skip": (i * 20) % SEED_NOTES, "limit": 20}))
+
+    async def list_hot_page(i):
+        _check(await client.get("/notes/", params={"skip": 0, "limit": 20}))
+
+    async def search_page(i):
+        word = SEARCH_WORDS[i % len(SEARCH_WORDS)]
+        _check(await client.get("/notes/", params={"skip": (i * 10) % 100, "limit": 10, "search": word}))
+
+    async def update(i):
+        _check(await client.put(f"/notes/{ids[i % len(ids)]}", json={"text": f"updated {i}"}))
+
+    async def delete(i):
+        _check(await client.delete(f"/notes/{deletable.pop()}"))
+
+    async def ping(i):
+        _check(await client.get("/bench/ping"))
+
+    async def ping_with_middleware(i):
+        _check(await env.cached_client.get("/bench/ping"))
+
+    async def list_with_middleware(i):
+        _check(await env.cached_client.get("/notes/", params={"skip": 0, "limit": 20}))
+
+    async def whoami(i):
+        _check(await client.get("/bench/whoami"))
+
+    async def jwt_decode(i):
+        jwt.decode(env.token, jwt_utils.SECRET_KEY, algorithms=[jwt_utils.ALGORITHM])
+
+    limiter = rate_limit.RateLimiter(env.cache_manager)
+
+    async def rate_limit_check(i):
+        assert (await limiter.check(f"rl:bench:{i % 50}", rate_limit.NOTES_READ_PER_USER)).allowed
+
+    signups = itertools.count()
+
+    async def register(i):
+        username = f"signup-{next(signups)}"
+        _check(await client.post("/users/register", json={"username": username, "password": "secret-pass"}))
+
+    async def register_duplicate(i):
+        r = await client.post("/users/register", json={"username": "bench", "password": "secret-pass"})
+        assert r.status_code == 400
+
+    async def enqueue(i):
+        _check(await client.post(
+            "/tasks/send-email",
+            json={"email": "bench@example.com", "subject": "s", "message": f"m{i}"},
+        ))
+
+    return [
+        Scenario("notes_create", create),
+        Scenario("note_read_miss", read_note, drop_note_key),
+        Scenario("note_read_hit", read_hot_note),
+        Scenario("note_read_304", read_not_modified),
+        Scenario("notes_list_miss", list_page, drop_list_keys),
+        Scenario("notes_list_hit", list_hot_page),
+        Scenario("notes_search_miss", search_page, drop_list_keys),
+        Scenario("notes_update", update),
+        Scenario("notes_delete", delete, seed_deletable),
+        Scenario("ping", ping),
+        Scenario("ping_cache_middleware", ping_with_middleware),
+        Scenario("notes_list_cache_middleware", list_with_middleware),
+        Scenario("auth_whoami", whoami),
+        Scenario("jwt_decode", jwt_decode),
+        Scenario("rate_limit_check", rate_limit_check),
+        Scenario("celery_enqueue", enqueue),
+        # bcrypt ~100+ мс на хеш: меньше запросов, параллелизм важнее
+        Scenario("users_register", register, requests=40),
+        Scenario("users_register_duplicate", register_duplicate, requests=40),
+    ]
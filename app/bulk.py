@@ -0,0 +1,231 @@
+"""
+Массовый экспорт и импорт заметок через COPY (только PostgreSQL).
+
+Экспорт: copy_from_query пишет чанки в ограниченную очередь, генератор
+ответа отдаёт их клиенту. В памяти не больше EXPORT_QUEUE_CHUNKS чанков,
+медленный клиент притормаживает сам COPY.
+
+Импорт: API только складывает тело запроса в файл в IMPORT_SPOOL_DIR
+(каталог общий с воркерами) и ставит tasks.import_notes_task. Воркер читает
+файл пачками в staging таблицу (copy_records_to_table) и одним
+INSERT ... SELECT переносит строки в notes в той же транзакции, что и
+счётчики note_stats.
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import uuid
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+import database
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_COLUMNS = "id, text, created_at, updated_at, version"
+EXPORT_QUEUE_CHUNKS = 16
+SPOOL_WRITE_BYTES = 1024 * 1024
+IMPORT_BATCH_ROWS = 10000
+
+
+class ImportTooLarge(Exception):
+    pass
+
+
+def supports_copy(owner_id: int) -> bool:
+    return database.engine_for_owner(owner_id).dialect.name == "postgresql"
+
+
+def _export_query(fmt: str):
+    select = f"SELECT {EXPORT_COLUMNS} FROM notes WHERE owner_id = $1 ORDER BY id"
+    if fmt == "csv":
+        return select, {"format": "csv", "header": True}
+    # NDJSON: JSON строки выводим как CSV с символами кавычки и разделителя,
+    # которых в JSON не бывает - COPY отдаёт их без экранирования, по строке на заметку
+    return f"SELECT row_to_json(n) FROM ({select}) n", {"format": "csv", "quote": "\x01", "delimiter": "\x02"}
+
+
+async def stream_export(owner_id: int, fmt: str) -> AsyncIterator[bytes]:
+    """Чанки COPY TO STDOUT для StreamingResponse; соединение берётся на время генератора"""
+    query, options = _export_query(fmt)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+
+    async def output(chunk):
+        await queue.put(bytes(chunk))
+
+    async def run_copy():
+        try:
+            async with database.engine_for_owner(owner_id).connect() as conn:
+                raw = await conn.get_raw_connection()
+                await raw.driver_connection.copy_from_query(query, owner_id, output=output, **options)
+        finally:
+            await queue.put(None)
+
+    task = asyncio.create_task(run_copy())
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            yield chunk
+        await task
+    finally:
+        # Клиент отключился - прерываем COPY, соединение вернётся в пул или будет закрыто
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+async def spool_upload(chunks: AsyncIterator[bytes], fmt: str) -> str:
+    """Пишет тело запроса в файл, не держа его в памяти; возвращает путь"""
+    os.makedirs(settings.IMPORT_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(settings.IMPORT_SPOOL_DIR, f"{uuid.uuid4().hex}.{fmt}")
+    size = 0
+    buffer = bytearray()
+    f = await run_in_threadpool(open, path, "wb")
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > settings.IMPORT_MAX_BYTES:
+                raise ImportTooLarge(f"Upload exceeds {settings.IMPORT_MAX_BYTES} bytes")
+            buffer += chunk
+            if len(buffer) >= SPOOL_WRITE_BYTES:
+                await run_in_threadpool(f.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(f.write, bytes(buffer))
+    except BaseException:
+        f.close()
+        os.remove(path)
+        raise
+    f.close()
+    logger.info("📥 Spooled %d bytes to %s", size, path)
+    return path
+
+
+class _RecordReader:
+    """
+    Пачки (text,) из NDJSON/CSV файла. Строки без text, с битым JSON/CSV,
+    невалидным UTF-8 или NUL (его не принимает Postgres) пропускаются и
+    считаются в skipped - одна плохая строка не роняет весь импорт.
+    """
+
+    def __init__(self, path: str, fmt: str):
+        self.raw = open(path, "rb")
+        # surrogateescape: невалидные байты не прерывают чтение, а отсеиваются в batches
+        self.stream = io.TextIOWrapper(self.raw, encoding="utf-8", errors="surrogateescape", newline="")
+        self.total_bytes = os.fstat(self.raw.fileno()).st_size
+        self.fmt = fmt
+        self.skipped = 0
+        # По умолчанию поле CSV ограничено 128К символов; заметка может быть до размера загрузки
+        csv.field_size_limit(max(csv.field_size_limit(), settings.IMPORT_MAX_BYTES))
+
+    def _texts(self) -> Iterator[Optional[str]]:
+        if self.fmt == "csv":
+            reader = csv.DictReader(self.stream)
+            while True:
+                try:
+                    row = next(reader)
+                except StopIteration:
+                    return
+                except csv.Error:
+                    yield None
+                    continue
+                yield row.get("text")
+        for line in self.stream:
+            if not line.strip():
+                continue
+            try:
+                value = json.loads(line).get("text")
+            except (ValueError, AttributeError, RecursionError):
+                value = None
+            yield value
+
+    @staticmethod
+    def _valid(value) -> bool:
+        if not isinstance(value, str) or "\x00" in value:
+            return False
+        try:
+            value.encode("utf-8")
+        except UnicodeEncodeError:
+            # Невалидные байты файла (surrogateescape) или одиночный \ud800 из JSON
+            return False
+        return True
+
+    def batches(self) -> Iterator[List[tuple]]:
+        batch = []
+        for value in self._texts():
+            if not self._valid(value):
+                self.skipped += 1
+                continue
+            batch.append((value,))
+            if len(batch) >= IMPORT_BATCH_ROWS:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @property
+    def bytes_read(self) -> int:
+        return self.raw.tell()
+
+    def close(self):
+        self.stream.close()
+
+
+async def import_file(path: str, owner_id: int, fmt: str, progress: Callable[[dict], None] = None) -> dict:
+    """Загружает файл в notes владельца одной транзакцией"""
+    reader = _RecordReader(path, fmt)
+    result = {"staged": 0, "imported": 0, "skipped": 0, "total_bytes": reader.total_bytes}
+    try:
+        async with database.engine_for_owner(owner_id).begin() as conn:
+            # Первый запрос через SQLAlchemy открывает транзакцию, COPY идёт в ней же
+            await conn.execute(text("CREATE TEMP TABLE notes_import (text text NOT NULL) ON COMMIT DROP"))
+            raw = (await conn.get_raw_connection()).driver_connection
+            for batch in reader.batches():
+                await raw.copy_records_to_table("notes_import", records=batch, columns=["text"])
+                result["staged"] += len(batch)
+                if progress:
+                    progress({**result, "skipped": reader.skipped, "bytes_read": reader.bytes_read})
+            status = await raw.execute(
+                "INSERT INTO notes (text, owner_id) SELECT text, $1 FROM notes_import", owner_id
+            )
+            result["imported"] = int(status.split()[-1])
+            await raw.execute(
+                "INSERT INTO note_stats (owner_id, note_count, last_modified) VALUES ($1, $2, now()) "
+                "ON CONFLICT (owner_id) DO UPDATE SET "
+                "note_count = note_stats.note_count + EXCLUDED.note_count, last_modified = now()",
+                owner_id, result["imported"],
+            )
+    finally:
+        reader.close()
+    result["skipped"] = reader.skipped
+    logger.info("📥 Imported %d notes for user %s (%d skipped)", result["imported"], owner_id, result["skipped"])
+    return result
+
+
+async def run_import(path: str, owner_id: int, fmt: str, progress: Callable[[dict], None] = None) -> dict:
+    """Импорт вне приложения (Celery задача): свои engine и Redis, файл удаляется в конце"""
+    from cache_keys import user_notes_index_key, user_notes_version_key
+    from redis_client import init_redis, close_redis, cache_manager
+
+    await database.init_engine()
+    try:
+        result = await import_file(path, owner_id, fmt, progress)
+        # Триггер NOTIFY тоже инвалидирует, но слушатель может быть выключен
+        await init_redis()
+        await cache_manager.delete_index(user_notes_index_key(owner_id))
+        await cache_manager.bump_version(user_notes_version_key(owner_id))
+        return result
+    finally:
+        await close_redis()
+        await database.dispose_engine()
+        if os.path.exists(path):
+            os.remove(path)
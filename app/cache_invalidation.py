@@ -0,0 +1,177 @@
+"""
+Инвалидация кеша по изменениям в БД (migrations/002_cache_invalidation_notify.sql).
+
+Один слушатель на процесс держит отдельное asyncpg соединение с
+LISTEN cache_invalidation, складывает события в очередь и пачками
+удаляет ровно затронутые ключи:
+
+    notes (id, owner) -> note:{id}:user:{owner}, индекс user_notes:{owner}:keys,
+                         версия коллекции владельца, индекс cache:notes:keys
+    users (id)        -> индекс user_notes:{id}:keys, версия коллекции, индекс cache:users:keys
+    TRUNCATE          -> всё пространство ключей таблицы
+
+Роутеры по-прежнему инвалидируют свои ключи сразу после записи
+(read-your-writes), слушатель покрывает записи в обход API.
+"""
+import asyncio
+import json
+import logging
+from typing import List, Optional, Set
+
+import asyncpg
+
+from cache_keys import note_key, response_cache_index_key, user_notes_index_key, user_notes_version_key
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_invalidation"
+MAX_QUEUE = 10000
+BATCH_SIZE = 500
+
+# Счётчики для /metrics
+stats = {"events_total": 0, "batches_total": 0, "overflows_total": 0, "reconnects_total": 0}
+
+
+def asyncpg_dsn(url: str) -> str:
+    """postgresql+asyncpg://... -> postgresql://... для asyncpg.connect"""
+    return url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+class CacheInvalidationListener:
+    def __init__(self, cache_manager, dsn: str, batch_ms: float = 50):
+        self.cache_manager = cache_manager
+        self.dsn = dsn
+        self.batch_window = batch_ms / 1000
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_QUEUE)
+        self._overflow = False
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._listen_forever()),
+            asyncio.create_task(self._consume_forever()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _on_notify(self, connection, pid, channel, payload):
+        stats["events_total"] += 1
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            # Не успеваем - после разбора очереди чистим всё пространство ключей
+            self._overflow = True
+
+    async def _listen_forever(self):
+        """Держит LISTEN соединение, переподключается с backoff"""
+        delay = 0.5
+        first = True
+        while True:
+            conn: Optional[asyncpg.Connection] = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                await conn.add_listener(CHANNEL, self._on_notify)
+                if not first:
+                    # События за время разрыва потеряны - чистим консервативно
+                    stats["reconnects_total"] += 1
+                    self._overflow = True
+                    self.queue.put_nowait("{}")
+                first = False
+                delay = 0.5
+                logger.info("👂 Listening for %s notifications", CHANNEL)
+                while not conn.is_closed():
+                    await asyncio.sleep(5)
+                    await conn.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Cache invalidation listener error: %r, reconnect in %.1fs", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+
+    async def _consume_forever(self):
+        while True:
+            first = await self.queue.get()
+            batch = [first]
+            # Короткое окно, чтобы собрать пачку событий одной транзакции/нагрузки
+            await asyncio.sleep(self.batch_window)
+            while len(batch) < BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self.apply(batch)
+            except Exception as e:
+                logger.error("Error applying cache invalidations: %s", e)
+
+    async def apply(self, payloads):
+        """Удаляет ключи, затронутые пачкой событий"""
+        stats["batches_total"] += 1
+        if self._overflow:
+            self._overflow = False
+            stats["overflows_total"] += 1
+            await self._flush_all()
+            return
+
+        keys: Set[str] = set()
+        owners: Set[int] = set()
+        namespaces: Set[str] = set()
+        for payload in payloads:
+            try:
+                event = json.loads(payload)
+            except ValueError:
+                continue
+            table = event.get("t")
+            if not table:
+                continue
+            namespaces.add(table)
+            if event.get("truncate"):
+                await self._flush_all()
+                return
+            if table == "notes":
+                owner = event.get("owner")
+                if owner is not None:
+                    owners.add(owner)
+                    if event.get("id") is not None:
+                        keys.add(note_key(event["id"], owner))
+            elif table == "users" and event.get("id") is not None:
+                owners.add(event["id"])
+
+        await self.cache_manager.delete_many(sorted(keys))
+        for owner in owners:
+            await self.cache_manager.delete_index(user_notes_index_key(owner))
+            await self.cache_manager.bump_version(user_notes_version_key(owner))
+        for namespace in namespaces:
+            await self.cache_manager.delete_index(response_cache_index_key(namespace))
+        logger.debug("🗑️ Invalidated %d keys, %d owners from %d events", len(keys), len(owners), len(payloads))
+
+    async def _flush_all(self):
+        logger.warning("Cache invalidation: flushing note keyspace")
+        for pattern in ("note:*", "user_notes:*", "user_notes_ver:*", "cache:*", "zvar:*"):
+            await self.cache_manager.delete_pattern(pattern)
+
+
+listeners: List[CacheInvalidationListener] = []
+
+
+async def start_listener(cache_manager) -> List[CacheInvalidationListener]:
+    """Запускается из lifespan; только для Postgres, по слушателю на основную БД и каждый шард"""
+    if not settings.CACHE_INVALIDATION_LISTENER or not settings.DATABASE_URL.startswith("postgresql"):
+        return []
+    for url in [settings.DATABASE_URL, *settings.DATABASE_SHARD_URLS]:
+        listener = CacheInvalidationListener(cache_manager, asyncpg_dsn(url), settings.CACHE_INVALIDATION_BATCH_MS)
+        listener.start()
+        listeners.append(listener)
+    return listeners
+
+
+async def stop_listener():
+    for listener in listeners:
+        await listener.stop()
+    listeners.clear()
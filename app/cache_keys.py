@@ -0,0 +1,69 @@
+"""
+Ключи кеша заметок. Формат ключей используется роутерами, прогревом кеша
+и инвалидацией - меняйте только здесь.
+"""
+from typing import Optional, Tuple
+
+NOTE_TTL = 600  # 10 минут для отдельных заметок
+NOTES_LIST_TTL = 300  # 5 минут для страниц списка
+
+
+def note_key(note_id: int, user_id: int) -> str:
+    return f"note:{note_id}:user:{user_id}"
+
+
+def user_notes_key(user_id: int, skip: int, limit: int, search: str = "") -> str:
+    return f"user_notes:{user_id}:{skip}:{limit}:{search or ''}"
+
+
+def user_notes_index_key(user_id: int) -> str:
+    """
+    SET ключей страниц списка и счётчиков пользователя: запись удаляет ровно
+    их (CacheManager.delete_index), без SCAN по всему keyspace
+    """
+    return f"user_notes:{user_id}:keys"
+
+
+def user_notes_stats_key(user_id: int) -> str:
+    """Индексируется в user_notes_index_key - сбрасывается вместе со страницами списка"""
+    return f"user_notes:{user_id}:stats"
+
+
+def response_cache_index_key(namespace: str) -> str:
+    """SET ключей CacheMiddleware пространства cache:{namespace}:*"""
+    return f"cache:{namespace}:keys"
+
+
+def user_notes_version_key(user_id: int) -> str:
+    """Версия коллекции заметок пользователя, растёт при каждой записи"""
+    return f"user_notes_ver:{user_id}"
+
+
+def compressed_key(key: str, encoding: str) -> str:
+    """
+    Предсжатый вариант значения. Префикс, а не суффикс: в конце ключа списка
+    стоит search из запроса, и search=foo|gzip совпал бы с вариантом страницы foo
+    """
+    return f"zvar:{encoding}:{key}"
+
+
+def parse_note_key(key: str) -> Optional[Tuple[int, int]]:
+    """note:{id}:user:{uid} -> (note_id, user_id)"""
+    parts = key.split(":")
+    if len(parts) != 4 or parts[0] != "note" or parts[2] != "user":
+        return None
+    try:
+        return int(parts[1]), int(parts[3])
+    except ValueError:
+        return None
+
+
+def parse_user_notes_key(key: str) -> Optional[Tuple[int, int, int, str]]:
+    """user_notes:{uid}:{skip}:{limit}:{search} -> (user_id, skip, limit, search)"""
+    parts = key.split(":", 4)
+    if len(parts) != 5 or parts[0] != "user_notes":
+        return None
+    try:
+        return int(parts[1]), int(parts[2]), int(parts[3]), parts[4]
+    except ValueError:
+        return None
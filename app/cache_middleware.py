@@ -4,6 +4,7 @@ from starlette.responses import JSONResponse
 import json
 import hashlib
 from typing import Optional
+from cache_keys import response_cache_index_key
 from redis_client import get_cache_manager
 import logging
 
@@ -18,7 +19,13 @@ class CacheMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         # Проверяем, нужно ли кешировать этот маршрут
         if not self._should_cache(request.url.path, request.method):
-            return await call_next(request)
+            response = await call_next(request)
+            if self._is_write(request.url.path, request.method) and response.status_code < 400:
+                # Сами сбрасываем ответы пространства: NOTIFY слушатель может быть
+                # выключен или БД не Postgres
+                cache_manager = await get_cache_manager()
+                await cache_manager.delete_index(response_cache_index_key(self._namespace(request.url.path)))
+            return response
         
         # Генерируем ключ кеша
         cache_key = self._generate_cache_key(request)
@@ -30,7 +37,7 @@ class CacheMiddleware(BaseHTTPMiddleware):
         if request.method == "GET":
             cached_response = await cache_manager.get(cache_key)
             if cached_response:
-                logger.info(f"🔄 Returning cached response for {request.url.path}")
+                logger.debug("🔄 Returning cached response for %s", request.url.path)
                 return JSONResponse(
                     content=cached_response,
                     status_code=200,
@@ -50,10 +57,13 @@ class CacheMiddleware(BaseHTTPMiddleware):
                 # Парсим JSON для кеширования
                 try:
                     json_data = json.loads(response_body.decode())
-                    await cache_manager.set(cache_key, json_data, self.ttl)
-                    logger.info(f"💾 Cached response for {request.url.path}")
+                    await cache_manager.set(
+                        cache_key, json_data, self.ttl,
+                        index=response_cache_index_key(self._namespace(request.url.path)),
+                    )
+                    logger.debug("💾 Cached response for %s", request.url.path)
                 except json.JSONDecodeError:
-                    logger.warning(f"Could not cache non-JSON response for {request.url.path}")
+                    logger.warning("Could not cache non-JSON response for %s", request.url.path)
                 
                 # Возвращаем новый response с тем же содержимым
                 return JSONResponse(
@@ -62,12 +72,10 @@ class CacheMiddleware(BaseHTTPMiddleware):
                     headers={"X-Cache": "MISS"}
                 )
             except Exception as e:
-                logger.error(f"Error caching response: {e}")
-        
-        # Для модифицирующих запросов - инвалидируем кеш
-        elif request.method in ["POST", "PUT", "DELETE", "PATCH"]:
-            await self._invalidate_cache(request.url.path, cache_manager)
+                logger.error("Error caching response: %s", e)
         
+        # Записи через API сбрасывают пространство выше, записи в обход API -
+        # cache_invalidation.py по NOTIFY из БД (индекс cache:{таблица}:keys)
         return response
     
     def _should_cache(self, path: str, method: str) -> bool:
@@ -77,6 +85,14 @@ class CacheMiddleware(BaseHTTPMiddleware):
             return False
         
         return any(route in path for route in self.cache_routes)
+
+    def _is_write(self, path: str, method: str) -> bool:
+        return method in ("POST", "PUT", "PATCH", "DELETE") and any(route in path for route in self.cache_routes)
+
+    @staticmethod
+    def _namespace(path: str) -> str:
+        """Первый сегмент пути (notes, users) - пространство ключей"""
+        return path.strip("/").split("/")[0] or "root"
     
     def _generate_cache_key(self, request: Request) -> str:
         """Генерирует уникальный ключ кеша для запроса"""
@@ -93,19 +109,9 @@ class CacheMiddleware(BaseHTTPMiddleware):
         if auth_header:
             key_parts.append(auth_header)
         
-        # Создаем хеш
+        # Создаем хеш; ключ попадает в индекс своего пространства при записи
         key_string = "|".join(key_parts)
-        return f"cache:{hashlib.md5(key_string.encode()).hexdigest()}"
-    
-    async def _invalidate_cache(self, path: str, cache_manager):
-        """Инвалидирует кеш для определенного пути"""
-        try:
-            # Удаляем все ключи, связанные с этим путем
-            pattern = f"cache:*"
-            await cache_manager.delete_pattern(pattern)
-            logger.info(f"🗑️ Invalidated cache for path: {path}")
-        except Exception as e:
-            logger.error(f"Error invalidating cache: {e}")
+        return f"cache:{self._namespace(request.url.path)}:{hashlib.md5(key_string.encode()).hexdigest()}"
 
 # Функция для создания middleware
 def create_cache_middleware(app, cache_routes: Optional[list] = None, ttl: int = 300):
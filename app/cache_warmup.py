@@ -0,0 +1,232 @@
+"""
+Прогрев кеша заметок после деплоя или failover'а Redis.
+
+Роутеры отмечают обращения к ключам в HotKeyTracker: семплированный
+Count-Min Sketch плюс небольшой список кандидатов. Периодически кандидаты
+сливаются в общий ZSET в Redis; старые счётчики затухают раз в интервал
+flush'а на весь кластер. warm_up()
+берёт самые популярные ключи, пропускает уже закешированные, читает
+данные из БД с ограничением QPS и пишет их в Redis pipeline'ами.
+
+Запуск вручную: python cache_warmup.py [--limit 500] [--qps 50]
+"""
+import asyncio
+import logging
+import random
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List
+
+from sqlalchemy.future import select
+
+from config import settings
+from cache_keys import parse_note_key, parse_user_notes_key, user_notes_index_key, NOTE_TTL, NOTES_LIST_TTL
+from crud import get_notes
+from models import Note
+import database
+
+logger = logging.getLogger(__name__)
+
+HOT_KEYS_ZSET = "hotkeys:notes"
+HOT_KEYS_DECAY_EPOCH = "hotkeys:decay_epoch"
+WARMUP_LOCK = "hotkeys:warmup_lock"
+BATCH_SIZE = 100
+
+# Снимаем блокировку, только если она всё ещё наша (долгий прогрев мог пережить TTL)
+RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class CountMinSketch:
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def add(self, key: str, count: int = 1) -> int:
+        """Увеличивает счётчик ключа и возвращает новую оценку частоты"""
+        estimate = None
+        for i, row in enumerate(self.rows):
+            idx = hash((i, key)) % self.width
+            row[idx] += count
+            estimate = row[idx] if estimate is None else min(estimate, row[idx])
+        return estimate
+
+
+class HotKeyTracker:
+    """Учитывает долю sample_rate обращений, держит top-K кандидатов в памяти процесса"""
+
+    def __init__(self, sample_rate: float, capacity: int):
+        self.sample_rate = sample_rate
+        self.capacity = capacity
+        self.sketch = CountMinSketch()
+        self.candidates: Dict[str, int] = {}
+
+    def record(self, key: str):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+        self.candidates[key] = self.sketch.add(key)
+        if len(self.candidates) > 2 * self.capacity:
+            top = sorted(self.candidates.items(), key=lambda kv: kv[1], reverse=True)[: self.capacity]
+            self.candidates = dict(top)
+
+    def drain(self) -> Dict[str, float]:
+        """Забирает накопленные оценки (в масштабе всех обращений) и сбрасывает скетч"""
+        scale = 1 / self.sample_rate if self.sample_rate > 0 else 0
+        snapshot = {key: count * scale for key, count in self.candidates.items()}
+        self.sketch = CountMinSketch()
+        self.candidates = {}
+        return snapshot
+
+    async def flush(self, redis, decay: float = 0.5, interval: float = None):
+        """
+        Сливает кандидатов в общий ZSET. Старые счётчики умножаются на decay
+        раз в interval на все процессы (ключ эпохи SET NX), а не при каждом
+        flush каждого пода - иначе рейтинг зависел бы от числа подов.
+        """
+        snapshot = self.drain()
+        interval = interval or settings.CACHE_HOTKEYS_FLUSH_SECONDS
+        decay_due = await redis.set(HOT_KEYS_DECAY_EPOCH, "1", nx=True, ex=max(int(interval), 1))
+        if not snapshot and not decay_due:
+            return
+        async with redis.pipeline(transaction=False) as pipe:
+            if decay_due:
+                pipe.zunionstore(HOT_KEYS_ZSET, {HOT_KEYS_ZSET: decay})
+            for key, score in snapshot.items():
+                pipe.zincrby(HOT_KEYS_ZSET, score, key)
+            pipe.zremrangebyrank(HOT_KEYS_ZSET, 0, -(settings.CACHE_WARMUP_KEYS * 2 + 1))
+            await pipe.execute()
+
+
+hot_keys = HotKeyTracker(settings.CACHE_HOTKEYS_SAMPLE_RATE, settings.CACHE_WARMUP_KEYS)
+
+
+async def flush_hot_keys_periodically(cache_manager):
+    """Фоновая задача приложения: раз в CACHE_HOTKEYS_FLUSH_SECONDS сливает счётчики в Redis"""
+    while True:
+        await asyncio.sleep(settings.CACHE_HOTKEYS_FLUSH_SECONDS)
+        try:
+            await hot_keys.flush(cache_manager.redis)
+        except Exception as e:
+            logger.warning("Hot keys flush failed: %s", e)
+
+
+class _Pacer:
+    """Не даёт делать больше qps запросов к БД в секунду"""
+
+    def __init__(self, qps: float):
+        self.interval = 1 / qps if qps > 0 else 0
+        self.next_at = time.monotonic()
+
+    async def wait(self):
+        now = time.monotonic()
+        if self.next_at > now:
+            await asyncio.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
+
+
+async def warm_up(cache_manager, limit: int = None, qps: float = None) -> Dict[str, int]:
+    """Заполняет кеш для самых популярных ключей, возвращает статистику"""
+    from routers.notes import serialize_note
+
+    limit = limit or settings.CACHE_WARMUP_KEYS
+    pacer = _Pacer(qps or settings.CACHE_WARMUP_QPS)
+    stats = {"candidates": 0, "missing": 0, "warmed": 0}
+
+    hot = await cache_manager.redis.zrevrange(HOT_KEYS_ZSET, 0, limit - 1)
+    stats["candidates"] = len(hot)
+    missing = await cache_manager.missing(hot) if hot else []
+    stats["missing"] = len(missing)
+
+    for start in range(0, len(missing), BATCH_SIZE):
+        batch = missing[start:start + BATCH_SIZE]
+        notes: Dict[str, dict] = {}
+        lists: Dict[str, List[dict]] = {}
+
+        # Ключи группируются по шарду владельца (None - без шардирования)
+        wanted: Dict[object, dict] = defaultdict(dict)
+        wanted_lists: Dict[object, list] = defaultdict(list)
+        for key in batch:
+            parsed = parse_note_key(key)
+            if parsed:
+                wanted[database.shard_for(parsed[1])][parsed] = key
+                continue
+            parsed_list = parse_user_notes_key(key)
+            if parsed_list:
+                wanted_lists[database.shard_for(parsed_list[0])].append((key, parsed_list))
+
+        for shard in set(wanted) | set(wanted_lists):
+            async with database.session_for_shard(shard) as db:
+                shard_wanted = wanted.get(shard)
+                if shard_wanted:
+                    await pacer.wait()
+                    # owner_id в условии - Postgres читает только партиции владельцев
+                    result = await db.execute(select(Note).where(
+                        Note.id.in_([note_id for note_id, _ in shard_wanted]),
+                        Note.owner_id.in_({owner_id for _, owner_id in shard_wanted}),
+                    ))
+                    for note in result.scalars().all():
+                        key = shard_wanted.get((note.id, note.owner_id))
+                        if key:
+                            notes[key] = serialize_note(note)
+
+                for key, (user_id, skip, limit_, search) in wanted_lists.get(shard, []):
+                    await pacer.wait()
+                    rows = await get_notes(user_id, db, skip=skip, limit=limit_, search=search)
+                    lists[key] = [serialize_note(note) for note in rows]
+
+        if notes:
+            await cache_manager.set_many(notes, ttl=NOTE_TTL)
+        if lists:
+            await cache_manager.set_many(
+                lists, ttl=NOTES_LIST_TTL,
+                indexes={key: user_notes_index_key(parse_user_notes_key(key)[0]) for key in lists},
+            )
+        stats["warmed"] += len(notes) + len(lists)
+
+    logger.info("🔥 Cache warm-up: %s", stats)
+    return stats
+
+
+async def warm_up_once(cache_manager, **kwargs):
+    """Прогрев под блокировкой: при старте нескольких воркеров греет только один"""
+    token = uuid.uuid4().hex
+    try:
+        if not await cache_manager.redis.set(WARMUP_LOCK, token, nx=True, ex=300):
+            logger.info("Cache warm-up already running in another process")
+            return None
+        try:
+            return await warm_up(cache_manager, **kwargs)
+        finally:
+            await cache_manager.redis.eval(RELEASE_LOCK_LUA, 1, WARMUP_LOCK, token)
+    except Exception as e:
+        logger.error("Cache warm-up failed: %s", e)
+        return None
+
+
+async def run_standalone(limit: int = None, qps: float = None):
+    """Прогрев вне приложения: Celery задача или CLI"""
+    from redis_client import init_redis, close_redis, cache_manager
+
+    await database.init_engine()
+    await init_redis()
+    try:
+        return await warm_up_once(cache_manager, limit=limit, qps=qps)
+    finally:
+        await close_redis()
+        await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Warm up notes cache")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--qps", type=float, default=None)
+    args = parser.parse_args()
+    print(asyncio.run(run_standalone(args.limit, args.qps)))
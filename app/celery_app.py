@@ -1,5 +1,7 @@
 from celery import Celery
+from celery.signals import setup_logging as celery_setup_logging
 from config import settings
+from logging_config import setup_logging
 
 
 celery_app = Celery(
@@ -18,4 +20,10 @@ celery_app.conf.update(
     task_track_started=True,
     task_time_limit=30 * 60,  # 30 минут
     task_soft_time_limit=25 * 60,  # 25 минут
-) 
\ No newline at end of file
+)
+
+
+@celery_setup_logging.connect
+def configure_worker_logging(**kwargs):
+    """Отключаем собственную настройку логов Celery - пишем через общий конвейер"""
+    setup_logging(settings.LOG_LEVEL, settings.LOG_FORMAT, settings.LOG_SAMPLE_RATES, settings.SQL_LOG_LEVEL)
@@ -0,0 +1,84 @@
+"""
+Circuit breaker для внешних зависимостей (Redis).
+
+closed    - вызовы идут как обычно, считаются подряд идущие ошибки;
+open      - после failure_threshold ошибок вызовы сразу отклоняются;
+half_open - через reset_timeout один вызывающий делает пробный запрос,
+            успех закрывает breaker, ошибка снова открывает.
+"""
+import logging
+import time
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.failures_total = 0
+        self.short_circuits_total = 0
+        self.opens_total = 0
+
+    def allow(self) -> bool:
+        """Можно ли выполнять вызов прямо сейчас"""
+        if self.state == CLOSED:
+            return True
+        self.short_circuits_total += 1
+        return False
+
+    def try_probe(self) -> bool:
+        """
+        True - вызывающий получил право на пробный запрос (breaker переходит
+        в half_open). Остальные продолжают получать отказ до результата пробы.
+        """
+        if self.state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+            self._set_state(HALF_OPEN)
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures_total += 1
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or (
+            self.state == CLOSED and self.consecutive_failures >= self.failure_threshold
+        ):
+            self.opened_at = self.clock()
+            self.opens_total += 1
+            self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        logger.warning("Circuit breaker %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "state": STATE_CODES[self.state],
+            "consecutive_failures": self.consecutive_failures,
+            "failures_total": self.failures_total,
+            "short_circuits_total": self.short_circuits_total,
+            "opens_total": self.opens_total,
+        }
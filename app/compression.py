@@ -0,0 +1,191 @@
+"""
+Сжатие ответов: gzip всегда, br и zstd - если установлены brotli / zstandard.
+
+Кодировка выбирается по Accept-Encoding (q-значения, при равенстве -
+порядок COMPRESSION_ENCODINGS). Тела меньше minimum_size не сжимаются.
+Ответы с уже выставленным Content-Encoding (предсжатые варианты из кеша,
+см. CacheManager.get_variant) проходят как есть.
+"""
+import gzip
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # опциональная зависимость
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # опциональная зависимость
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # 11 по умолчанию - слишком дорого для ответов на лету
+ZSTD_LEVEL = 3
+
+
+def _gzip_stream():
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+class _BrotliStream:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.finish()
+
+
+class _ZstdStream:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+
+def available_encodings() -> List[str]:
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(data, GZIP_LEVEL, mtime=0)
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def compressor(encoding: str):
+    """Потоковый компрессор с методами compress(chunk) и flush()"""
+    if encoding == "gzip":
+        return _gzip_stream()
+    if encoding == "br":
+        return _BrotliStream()
+    if encoding == "zstd":
+        return _ZstdStream()
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def choose_encoding(accept_encoding: Optional[str], encodings: Iterable[str]) -> Optional[str]:
+    """Лучшая из encodings по заголовку Accept-Encoding или None"""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def weak_etag(etag: Optional[str]) -> Optional[str]:
+    """Сжатое представление - другие байты, строгий ETag становится слабым"""
+    if etag and not etag.startswith("W/"):
+        return f"W/{etag}"
+    return etag
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, encodings: Iterable[str] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        supported = available_encodings()
+        self.encodings = [e for e in (encodings or supported) if e in supported]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSender(send, encoding, self.minimum_size))
+
+
+class _CompressingSender:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.passthrough = False
+        self.stream = None
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            if "content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+                self.passthrough = True
+                await self.send(message)
+            else:
+                self.start = message
+            return
+
+        if self.passthrough or message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.stream is None:
+            headers = MutableHeaders(scope=self.start)
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body:
+                # Ответ целиком: маленькие тела отправляем как есть
+                if len(body) >= self.minimum_size:
+                    body = compress(body, self.encoding)
+                    self._mark_compressed(headers)
+                    headers["Content-Length"] = str(len(body))
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            # Потоковый ответ (экспорт): сжимаем по чанкам
+            self.stream = compressor(self.encoding)
+            self._mark_compressed(headers)
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            await self.send(self.start)
+
+        chunk = self.stream.compress(body)
+        if not more_body:
+            chunk += self.stream.flush()
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    def _mark_compressed(self, headers: MutableHeaders):
+        headers["Content-Encoding"] = self.encoding
+        if "etag" in headers:
+            headers["ETag"] = weak_etag(headers["etag"])
@@ -1,20 +1,9 @@
-from models import Note
+from models import Note, NoteStats
 from schemas.note import NoteCreate, NoteUpdate, NoteOut
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from models import User
 
-async def create_note(note_data: NoteCreate, user_id: int, db: AsyncSession):
-    new_note = Note(
-        text=note_data.text,
-        owner_id=user_id
-    )
-    db.add(new_note)
-    await db.commit()
-    await db.refresh(new_note)
-    return new_note
-
-
 async def get_all_notes(session: AsyncSession):
     result = await session.execute(select(Note))
     notes = result.scalars().all()
@@ -25,15 +14,44 @@ from sqlalchemy.exc import IntegrityError
 from schemas.user import UserCreate, UserLogin, UserOut, TokenData
 from models import User
 from sqlalchemy.ext.asyncio import AsyncSession
-from auth import get_password_hash
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy import func
+from auth import get_password_hash_async
+
+def _insert(session: AsyncSession):
+    """INSERT с поддержкой ON CONFLICT для диалекта текущей сессии"""
+    if session.get_bind().dialect.name == "sqlite":
+        return sqlite.insert
+    return postgresql.insert
+
+async def _bump_note_stats(user_id: int, delta: int, db: AsyncSession):
+    """
+    Upsert счётчиков владельца в текущей транзакции (коммитит вызывающий).
+    Строка блокируется до конца транзакции - конкурентные записи одного
+    владельца сериализуются на ней, счётчик не расходится с notes.
+    """
+    stmt = _insert(db)(NoteStats).values(owner_id=user_id, note_count=max(delta, 0), last_modified=func.now())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[NoteStats.owner_id],
+        set_={"note_count": NoteStats.note_count + delta, "last_modified": func.now()},
+    )
+    await db.execute(stmt)
 
 async def create_user(user: UserCreate, session: AsyncSession):
-    hashed_password = get_password_hash(user.password)
-    new_user = User(username=user.username, password=hashed_password, role='user')
-    session.add(new_user)
+    """
+    Один round-trip: INSERT ... ON CONFLICT (username) DO NOTHING RETURNING.
+    Возвращает None, если имя уже занято (проверку делает уникальный индекс).
+    """
+    hashed_password = await get_password_hash_async(user.password)
+    stmt = (
+        _insert(session)(User)
+        .values(username=user.username, password=hashed_password, role="user")
+        .on_conflict_do_nothing(index_elements=[User.username])
+        .returning(User)
+    )
     try:
+        new_user = (await session.execute(stmt)).scalars().first()
         await session.commit()
-        await session.refresh(new_user)
         return new_user
     except IntegrityError:
         await session.rollback()
@@ -44,12 +62,12 @@ async def get_user_by_username(username: str, session: AsyncSession):
     return result.scalars().first()
 
 
-from auth import verify_password  # импортируй, если не импортировал
+from auth import verify_password_async
 
 async def authenticate_user(user: UserLogin, session: AsyncSession):
     result = await session.execute(select(User).where(User.username == user.username))
     db_user = result.scalars().first()
-    if db_user and verify_password(user.password, db_user.password):
+    if db_user and await verify_password_async(user.password, db_user.password):
         return db_user
     return None
 
@@ -64,6 +82,7 @@ async def create_note(note_data, user_id: int, db: AsyncSession):
         owner_id=user_id
     )
     db.add(new_note)
+    await _bump_note_stats(user_id, 1, db)
     await db.commit()
     await db.refresh(new_note)
     return new_note
@@ -98,6 +117,7 @@ async def update_note(note_id: int, user_id: int, data, db: AsyncSession):
     if note:
         for key, value in data.dict(exclude_unset=True).items():
             setattr(note, key, value)
+        await _bump_note_stats(user_id, 0, db)
         await db.commit()
         await db.refresh(note)
     return note
@@ -106,5 +126,11 @@ async def delete_note(note_id: int, user_id: int, db: AsyncSession):
     note = await get_note(note_id, user_id, db)
     if note:
         await db.delete(note)
+        await _bump_note_stats(user_id, -1, db)
         await db.commit()
-    return note
\ No newline at end of file
+    return note
+
+async def get_note_stats(user_id: int, db: AsyncSession):
+    """Количество заметок и время последнего изменения - чтение по первичному ключу"""
+    stats = await db.get(NoteStats, user_id)
+    return stats or NoteStats(owner_id=user_id, note_count=0, last_modified=None)
\ No newline at end of file
@@ -1,13 +1,117 @@
+import asyncio
+from typing import Optional
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import settings
+from profiling import install_sqlalchemy_hooks
 
-engine = create_async_engine(settings.DATABASE_URL, echo=True)
-AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+# Engine создаётся в lifespan приложения (init_engine), а не при импорте
+engine = None
+AsyncSessionLocal = sessionmaker(class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
 
+# Шардирование заметок по владельцу (DATABASE_SHARD_URLS), пользователи остаются в engine.
+# Заметки, уже лежащие в DATABASE_URL, сами не переезжают: перед включением
+# шардов их переносит shard_backfill.py, иначе приложение не стартует
+# (ensure_no_unsharded_notes).
+shard_engines = []
+shard_sessions = []
+
+class ShardRouter:
+    """
+    Владелец -> номер шарда. По умолчанию owner_id % N; для своей схемы
+    размещения (таблица соответствий, consistent hashing) подмените
+    через set_shard_router до init_engine.
+    """
+    def __init__(self, shard_count: int):
+        self.shard_count = shard_count
+
+    def shard_for(self, owner_id: int) -> int:
+        return owner_id % self.shard_count
+
+shard_router: Optional[ShardRouter] = None
+
+def set_shard_router(router: ShardRouter):
+    global shard_router
+    shard_router = router
+
+def shard_for(owner_id: int) -> Optional[int]:
+    """Номер шарда владельца или None без шардирования"""
+    if not shard_sessions:
+        return None
+    return shard_router.shard_for(owner_id)
+
+def session_for_shard(shard: Optional[int]) -> AsyncSession:
+    if shard is None:
+        return AsyncSessionLocal()
+    return shard_sessions[shard]()
+
+def notes_session(owner_id: int) -> AsyncSession:
+    """Сессия БД, где лежат заметки владельца"""
+    return session_for_shard(shard_for(owner_id))
+
+def engine_for_owner(owner_id: int):
+    """Engine БД с заметками владельца - для работы с драйвером напрямую (COPY)"""
+    shard = shard_for(owner_id)
+    return engine if shard is None else shard_engines[shard]
+
+def _create_engine(url: str):
+    new_engine = create_async_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+    )
+    if settings.PROFILING_ENABLED:
+        install_sqlalchemy_hooks(new_engine)
+    return new_engine
+
+async def init_engine(url: str = None):
+    """Создаёт engine (и engine'ы шардов) и заранее открывает соединения пула"""
+    global engine, shard_router
+    if engine is None:
+        engine = _create_engine(url or settings.DATABASE_URL)
+        AsyncSessionLocal.configure(bind=engine)
+        for shard_url in settings.DATABASE_SHARD_URLS:
+            shard_engine = _create_engine(shard_url)
+            shard_engines.append(shard_engine)
+            shard_sessions.append(sessionmaker(bind=shard_engine, class_=AsyncSession, expire_on_commit=False))
+        if shard_engines and shard_router is None:
+            shard_router = ShardRouter(len(shard_engines))
+    await _warm_up_pool(min(settings.DB_POOL_WARMUP, settings.DB_POOL_SIZE))
+    return engine
+
+async def ensure_no_unsharded_notes():
+    """С шардами заметки читаются только с шардов - оставшиеся в основной БД пропали бы для владельцев"""
+    if not shard_engines:
+        return
+    async with engine.connect() as conn:
+        left = (await conn.execute(text("SELECT EXISTS (SELECT 1 FROM notes)"))).scalar()
+    if left:
+        raise RuntimeError(
+            "DATABASE_SHARD_URLS is set but DATABASE_URL still has notes: run shard_backfill.py first"
+        )
+
+async def _warm_up_pool(size: int):
+    """Открывает size соединений одновременно, после возврата они остаются в пуле"""
+    async def ping(target):
+        async with target.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    if size > 0:
+        await asyncio.gather(*(ping(target) for target in [engine, *shard_engines] for _ in range(size)))
+
+async def dispose_engine():
+    global engine
+    if engine is not None:
+        await engine.dispose()
+        engine = None
+    for shard_engine in shard_engines:
+        await shard_engine.dispose()
+    shard_engines.clear()
+    shard_sessions.clear()
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
-
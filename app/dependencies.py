@@ -2,13 +2,13 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
+import database
 from database import get_db
 from models import User
 from auth import SECRET_KEY, ALGORITHM
 from crud import get_user_by_username
 from schemas.user import TokenData
 import jwt_utils
-from typing import AsyncGenerator
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
@@ -32,6 +32,17 @@ async def get_current_user(token: str = Depends(oauth2_scheme), session: AsyncSe
         raise credentials_exception
     return user
 
+async def get_notes_db(current_user: User = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    """
+    Сессия с заметками текущего пользователя. Без шардирования - та же
+    сессия, что у get_current_user (одно соединение пула на запрос).
+    """
+    if database.shard_for(current_user.id) is None:
+        yield session
+        return
+    async with database.notes_session(current_user.id) as shard_session:
+        yield shard_session
+
 def require_role(required_role: str):
     async def role_checker(current_user: User = Depends(get_current_user)):
         if current_user.role != required_role:
@@ -41,7 +52,3 @@ def require_role(required_role: str):
             )
         return current_user
     return role_checker
-
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session() as session:
-        yield session
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""
+Строгие ETag для заметок и списков заметок.
+
+Заметка: id + version (колонка notes.version, растёт при каждом UPDATE).
+Список: версия коллекции пользователя в Redis (CacheManager.get_version),
+которую увеличивает каждая запись + параметры страницы.
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Request
+
+
+def note_etag(note_id: int, version: Optional[int]) -> Optional[str]:
+    if version is None:
+        return None
+    return f'"n{note_id}.{version}"'
+
+
+def collection_etag(user_id: int, version: Optional[int], skip: int, limit: int, search: str = "") -> Optional[str]:
+    if version is None:
+        return None
+    params = hashlib.blake2s(f"{skip}:{limit}:{search or ''}".encode(), digest_size=6).hexdigest()
+    return f'"l{user_id}.{version}.{params}"'
+
+
+def if_none_match(request: Request, etag: Optional[str]) -> bool:
+    """True, если клиент уже имеет это представление (ответ 304)"""
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    if header.strip() == "*":
+        return True
+    # Для If-None-Match сравнение слабое: W/"x" совпадает с "x"
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
@@ -1,18 +1,19 @@
-from database import SessionLocal
+import asyncio
+from sqlalchemy.future import select
+from database import init_engine, dispose_engine, AsyncSessionLocal
 from models import User
-from passlib.context import CryptContext
+from auth import get_password_hash
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def hash_passwords():
-    db = SessionLocal()
-    users = db.query(User).all()
-    for user in users:
-        if not user.password.startswith("$2b$"):  # значит пароль не хеширован
-            user.password = pwd_context.hash(user.password)
-            print(f"Хешируем пароль для пользователя: {user.username}")
-    db.commit()
-    db.close()
+async def hash_passwords():
+    await init_engine()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User))
+        for user in result.scalars().all():
+            if not user.password.startswith("$2b$"):  # значит пароль не хеширован
+                user.password = get_password_hash(user.password)
+                print(f"Хешируем пароль для пользователя: {user.username}")
+        await db.commit()
+    await dispose_engine()
 
 if __name__ == "__main__":
-    hash_passwords()
+    asyncio.run(hash_passwords())
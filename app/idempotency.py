@@ -0,0 +1,149 @@
+"""
+Idempotency-Key для POST запросов, создающих данные или задачи.
+
+Первый запрос с ключом занимает его в Redis (SET NX, короткий TTL на
+случай падения процесса), выполняется и сохраняет ответ на
+IDEMPOTENCY_TTL_SECONDS. Повтор с тем же ключом получает сохранённый
+ответ (заголовок Idempotent-Replayed: true); параллельный дубликат ждёт
+завершения первого. Тот же ключ с другим телом - 422.
+
+Если Redis недоступен (breaker CacheManager открыт), запрос выполняется
+без защиты от повторов - как и rate limiting, это fail-open.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+PENDING = "pending"
+DONE = "done"
+
+# Счётчики для /metrics
+stats = {"acquired_total": 0, "replayed_total": 0, "waited_total": 0, "conflicts_total": 0, "unavailable_total": 0}
+
+_UNAVAILABLE = object()
+
+
+def fingerprint(payload: Any) -> str:
+    """Хеш тела запроса: повтор должен совпадать с оригиналом"""
+    if isinstance(payload, BaseModel):
+        data = payload.model_dump_json()
+    else:
+        data = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.blake2s(data.encode(), digest_size=16).hexdigest()
+
+
+class Idempotency:
+    """
+    async with Idempotency(request, "notes:1", body, cache_manager) as idem:
+        if idem.replay:
+            return idem.replay
+        ...
+        idem.store(response_body, status_code, headers)
+
+    Без заголовка Idempotency-Key ничего не делает. Исключение внутри
+    блока освобождает ключ, чтобы клиент мог повторить запрос.
+    """
+
+    def __init__(self, request: Request, scope: str, payload: Any, cache_manager):
+        self.cache_manager = cache_manager
+        self.client_key = request.headers.get(HEADER)
+        self.redis_key = f"idem:{scope}:{self.client_key}"
+        self.fingerprint = fingerprint(payload) if self.client_key else None
+        self.acquired = False
+        self.replay: Optional[JSONResponse] = None
+        self._result: Optional[Dict[str, Any]] = None
+
+    async def __aenter__(self) -> "Idempotency":
+        if not self.client_key:
+            return self
+        if len(self.client_key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"{HEADER} is too long")
+        await self._acquire_or_wait()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self.acquired:
+            return
+        if exc_type is None and self._result is not None:
+            record = json.dumps({"state": DONE, "fp": self.fingerprint, **self._result})
+            stored = await self.cache_manager.run(
+                "idempotency_store",
+                lambda: self.cache_manager.redis.set(self.redis_key, record, ex=settings.IDEMPOTENCY_TTL_SECONDS),
+            )
+            if stored:
+                return
+            # Иначе повторы до истечения IDEMPOTENCY_LOCK_SECONDS ждали бы pending и получали 409
+            logger.warning("Could not store idempotent response for %s, releasing the key", self.redis_key)
+        await self.cache_manager.run("idempotency_release", lambda: self.cache_manager.redis.delete(self.redis_key))
+
+    def store(self, body: Any, status_code: int = 200, headers: Dict[str, str] = None):
+        """Ответ, который получат повторы этого запроса"""
+        self._result = {"status": status_code, "body": body, "headers": headers or {}}
+
+    async def _acquire_or_wait(self):
+        pending = json.dumps({"state": PENDING, "fp": self.fingerprint})
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_MS / 1000
+        delay = 0.02
+        waited = False
+        while True:
+            acquired = await self.cache_manager.run(
+                "idempotency_acquire",
+                lambda: self.cache_manager.redis.set(
+                    self.redis_key, pending, nx=True, ex=settings.IDEMPOTENCY_LOCK_SECONDS
+                ),
+                _UNAVAILABLE,
+            )
+            if acquired is _UNAVAILABLE:
+                stats["unavailable_total"] += 1
+                logger.warning("Idempotency store unavailable, executing %s without it", self.redis_key)
+                return
+            if acquired:
+                stats["acquired_total"] += 1
+                self.acquired = True
+                return
+
+            raw = await self.cache_manager.run("idempotency_get", lambda: self.cache_manager.redis.get(self.redis_key))
+            if raw is None:
+                # Ключ истёк или освобождён между SET и GET - пробуем занять снова
+                continue
+            record = json.loads(raw)
+            if record.get("fp") != self.fingerprint:
+                stats["conflicts_total"] += 1
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"{HEADER} was already used with a different request body",
+                )
+            if record["state"] == DONE:
+                stats["replayed_total"] += 1
+                self.replay = JSONResponse(
+                    content=record["body"],
+                    status_code=record["status"],
+                    headers={**record["headers"], "Idempotent-Replayed": "true"},
+                )
+                return
+
+            # Первый запрос ещё выполняется - ждём его результат
+            if not waited:
+                stats["waited_total"] += 1
+                waited = True
+            if time.monotonic() + delay > deadline:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"A request with this {HEADER} is still in progress",
+                    headers={"Retry-After": "1"},
+                )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.25)
@@ -0,0 +1,120 @@
+"""
+Настройка логирования: запись в stdout вынесена в отдельный поток
+(QueueHandler/QueueListener), форматирование ленивое, частые события
+семплируются, вывод - JSON или текст.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from typing import Dict, Optional
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Стандартные атрибуты LogRecord - всё остальное пришло через extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись в одну строку JSON, поля из extra попадают в объект"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю записей с заданным event (extra={"event": ...}).
+    Записи без event или с неизвестным event проходят всегда.
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rates = dict(rates or {})
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(getattr(record, "event", None))
+        if rate is None or rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Стандартный QueueHandler.prepare() форматирует сообщение в вызывающем
+    потоке. Очередь у нас in-process, поэтому кладём копию записи как есть -
+    форматирование выполнит поток QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+
+def setup_logging(
+    level: str = "INFO",
+    fmt: str = "json",
+    sample_rates: Optional[Dict[str, float]] = None,
+    sql_level: str = "WARNING",
+) -> logging.handlers.QueueListener:
+    """Настраивает корневой логгер. Повторный вызов пересоздаёт listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    if fmt == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        formatter.converter = time.gmtime
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    # SQL пишем через тот же конвейер, а не через echo=True (свой синхронный StreamHandler)
+    logging.getLogger("sqlalchemy.engine").setLevel(sql_level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """Дописывает очередь и останавливает поток listener'а"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -1,35 +1,113 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.ext.asyncio import AsyncSession
-from schemas.note import NoteCreate, NoteOut
-from database import get_db
-from redis_client import get_cache_manager
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
+from fastapi.responses import PlainTextResponse
 from config import settings
-import crud
-import json
-
-app = FastAPI(title=settings.PROJECT_NAME, version="1.0.0")
-
-@app.post("/notes", response_model=NoteOut)
-async def create_note(
-    note: NoteCreate,
-    session: AsyncSession = Depends(get_db),
-    cache_manager = Depends(get_cache_manager)
-):
-    created_note = await crud.create_note(note, user_id=1, db=session)  # user_id=1 для примера
-    # Инвалидация кеша
-    await cache_manager.delete_pattern("notes:all*")
-    return created_note
-
-@app.get("/notes", response_model=list[NoteOut])
-async def read_notes(
-    session: AsyncSession = Depends(get_db),
-    cache_manager = Depends(get_cache_manager)
-):
-    cache_key = "notes:all"
-    cached = await cache_manager.get(cache_key)
-    if cached:
-        return cached
-    notes = await crud.get_all_notes(session)
-    serialized = [note.model_dump() for note in notes]
-    await cache_manager.set(cache_key, serialized, ttl=300)
-    return serialized
+from logging_config import setup_logging, shutdown_logging
+from database import init_engine, dispose_engine, ensure_no_unsharded_notes
+from redis_client import init_redis, close_redis, get_cache_manager, cache_manager
+from cache_warmup import hot_keys, flush_hot_keys_periodically, warm_up_once
+from cache_invalidation import start_listener, stop_listener
+import cache_invalidation
+from profiling import ProfilingMiddleware
+from admission import ConcurrencyLimitMiddleware
+from compression import CompressionMiddleware
+import admission
+import rate_limit
+import idempotency
+from routers import admin, notes, tasks, users
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Логирование, подключения к БД и Redis живут вместе с приложением"""
+    # Поток QueueListener стартует здесь, а не при импорте main (тесты, celery, бенчмарки)
+    setup_logging(settings.LOG_LEVEL, settings.LOG_FORMAT, settings.LOG_SAMPLE_RATES, settings.SQL_LOG_LEVEL)
+    started = time.perf_counter()
+    await init_engine()
+    await ensure_no_unsharded_notes()
+    await init_redis()
+    background = [asyncio.create_task(flush_hot_keys_periodically(cache_manager))]
+    if settings.CACHE_WARMUP_ON_STARTUP:
+        # Прогрев идёт в фоне и не задерживает готовность
+        background.append(asyncio.create_task(warm_up_once(cache_manager)))
+    # Инвалидация по NOTIFY из БД (только Postgres)
+    await start_listener(cache_manager)
+    logger.info("🚀 Startup finished in %.1f ms", (time.perf_counter() - started) * 1000)
+    yield
+    await stop_listener()
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    try:
+        await hot_keys.flush(cache_manager.redis)
+    except Exception as e:
+        logger.warning("Hot keys flush failed: %s", e)
+    await close_redis()
+    await dispose_engine()
+    shutdown_logging()
+
+def create_app() -> FastAPI:
+    app = FastAPI(title=settings.PROJECT_NAME, version="1.0.0", lifespan=lifespan)
+    app.include_router(notes.router)
+    app.include_router(tasks.router)
+    app.include_router(users.router)
+    app.include_router(admin.router)
+
+    if settings.PROFILING_ENABLED:
+        app.add_middleware(
+            ProfilingMiddleware,
+            sample_rate=settings.PROFILE_SAMPLE_RATE,
+            slow_ms=settings.PROFILE_SLOW_MS,
+            interval_ms=settings.PROFILE_INTERVAL_MS,
+            header_secret=settings.PROFILE_HEADER_SECRET,
+        )
+
+    if settings.COMPRESSION_ENABLED:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.COMPRESSION_MIN_SIZE,
+            encodings=settings.COMPRESSION_ENCODINGS,
+        )
+
+    # Добавлен последним - внешний слой: отказ до любой работы с БД/Redis
+    app.add_middleware(
+        ConcurrencyLimitMiddleware,
+        limit=settings.MAX_CONCURRENT_REQUESTS or settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+        max_queue=settings.MAX_QUEUED_REQUESTS,
+        queue_timeout_ms=settings.QUEUE_TIMEOUT_MS,
+    )
+
+    @app.get("/health")
+    async def health(cache_manager = Depends(get_cache_manager)):
+        """Readiness: отвечает только после завершения lifespan startup"""
+        return {
+            "status": "ok",
+            "redis": await cache_manager.health_check(),
+            "cache_breaker": cache_manager.breaker.state,
+        }
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics(cache_manager = Depends(get_cache_manager)):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        sources = (
+            ("cache_breaker", cache_manager.breaker.metrics()),
+            ("admission", admission.stats),
+            ("rate_limit", rate_limit.stats),
+            ("idempotency", idempotency.stats),
+            ("cache_invalidation", cache_invalidation.stats),
+        )
+        for prefix, values in sources:
+            for name, value in values.items():
+                metric = f"{prefix}_{name}"
+                kind = "counter" if name.endswith("_total") else "gauge"
+                lines += [f"# TYPE {metric} {kind}", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+    return app
+
+app = create_app()
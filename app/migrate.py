@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Применяет SQL миграции из migrations/ по порядку имён файлов.
+Применённые записываются в schema_migrations, каждая идёт в своей транзакции.
+
+Запуск: python migrate.py [--dry-run] [--url URL [--shard]]
+(--url - например, для каждого из DATABASE_SHARD_URLS; --shard - база шарда:
+без таблицы users и внешних ключей на неё, см. 000_base_schema.sql)
+"""
+import argparse
+import asyncio
+import os
+
+from sqlalchemy import text
+
+import database
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+async def migrate(dry_run: bool = False, url: str = None, shard: bool = False):
+    engine = await database.init_engine(url)
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name text PRIMARY KEY, applied_at timestamptz NOT NULL DEFAULT now())"
+        ))
+        applied = set((await conn.execute(text("SELECT name FROM schema_migrations"))).scalars().all())
+
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not name.endswith(".sql") or name in applied:
+            continue
+        print(f"{'would apply' if dry_run else 'applying'} {name}")
+        if dry_run:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, name), encoding="utf-8") as f:
+            sql = f.read()
+        async with engine.begin() as conn:
+            # INSERT открывает транзакцию, SQL файла выполняется в ней же
+            await conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+            # Флаг видят миграции через current_setting('migrate.shard', true), только в этой транзакции
+            await conn.execute(text("SELECT set_config('migrate.shard', :shard, true)"), {"shard": "on" if shard else "off"})
+            # Несколько statements в одном файле - через простой протокол драйвера
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.execute(sql)
+
+    await database.dispose_engine()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply SQL migrations")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--url", help="database URL instead of DATABASE_URL")
+    parser.add_argument("--shard", action="store_true", help="the database is a notes shard without users")
+    args = parser.parse_args()
+    if args.shard and not args.url:
+        parser.error("--shard requires --url")
+    asyncio.run(migrate(args.dry_run, args.url, args.shard))
@@ -0,0 +1,29 @@
+-- Исходная схема (models.User, models.Note до 001). На существующих базах
+-- ничего не меняет. На шарде (migrate.py --shard) таблицы users нет:
+-- пользователи живут в основной БД, а внешние ключи между базами невозможны,
+-- поэтому следующие миграции создают ссылки на users только при её наличии.
+
+DO $$
+BEGIN
+    IF current_setting('migrate.shard', true) IS DISTINCT FROM 'on' AND to_regclass('users') IS NULL THEN
+        CREATE TABLE users (
+            id serial PRIMARY KEY,
+            username varchar NOT NULL,
+            password varchar NOT NULL,
+            role varchar DEFAULT 'user'
+        );
+        CREATE UNIQUE INDEX ix_users_username ON users (username);
+    END IF;
+
+    IF to_regclass('notes') IS NULL THEN
+        CREATE TABLE notes (
+            id serial PRIMARY KEY,
+            text varchar NOT NULL,
+            created_at timestamptz DEFAULT now(),
+            owner_id integer
+        );
+        IF to_regclass('users') IS NOT NULL THEN
+            ALTER TABLE notes ADD FOREIGN KEY (owner_id) REFERENCES users(id);
+        END IF;
+    END IF;
+END $$;
@@ -0,0 +1,5 @@
+-- ETag для заметок: версия строки и время последнего изменения
+ALTER TABLE notes ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1;
+ALTER TABLE notes ADD COLUMN IF NOT EXISTS updated_at timestamptz;
+UPDATE notes SET updated_at = created_at WHERE updated_at IS NULL;
+ALTER TABLE notes ALTER COLUMN updated_at SET DEFAULT now();
@@ -0,0 +1,55 @@
+-- Change feed для инвалидации кеша: любая запись в notes/users (API,
+-- миграции, скрипты, ручной SQL) отправляет NOTIFY cache_invalidation.
+-- Слушает cache_invalidation.CacheInvalidationListener.
+--
+-- Для INSERT id не передаётся: новой заметки в кеше ещё нет, а одинаковые
+-- payload'ы в одной транзакции Postgres склеивает - массовая вставка даёт
+-- одно событие на владельца.
+
+CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'notes' THEN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM pg_notify('cache_invalidation', json_build_object('t', 'notes', 'owner', NEW.owner_id)::text);
+        ELSIF TG_OP = 'UPDATE' THEN
+            PERFORM pg_notify('cache_invalidation', json_build_object('t', 'notes', 'id', NEW.id, 'owner', NEW.owner_id)::text);
+            IF OLD.owner_id IS DISTINCT FROM NEW.owner_id THEN
+                PERFORM pg_notify('cache_invalidation', json_build_object('t', 'notes', 'id', OLD.id, 'owner', OLD.owner_id)::text);
+            END IF;
+        ELSE
+            PERFORM pg_notify('cache_invalidation', json_build_object('t', 'notes', 'id', OLD.id, 'owner', OLD.owner_id)::text);
+        END IF;
+    ELSE
+        PERFORM pg_notify('cache_invalidation', json_build_object('t', TG_TABLE_NAME, 'id', OLD.id)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_cache_truncate() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('cache_invalidation', json_build_object('t', TG_TABLE_NAME, 'truncate', true)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notes_cache_invalidation ON notes;
+CREATE TRIGGER notes_cache_invalidation
+    AFTER INSERT OR UPDATE OR DELETE ON notes
+    FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation();
+
+DROP TRIGGER IF EXISTS notes_cache_truncate ON notes;
+CREATE TRIGGER notes_cache_truncate
+    AFTER TRUNCATE ON notes
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_cache_truncate();
+
+-- На шардах таблицы users нет (000_base_schema.sql)
+DO $$
+BEGIN
+    IF to_regclass('users') IS NOT NULL THEN
+        DROP TRIGGER IF EXISTS users_cache_invalidation ON users;
+        CREATE TRIGGER users_cache_invalidation
+            AFTER UPDATE OR DELETE ON users
+            FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation();
+    END IF;
+END $$;
@@ -0,0 +1,25 @@
+-- Счётчики заметок по владельцу (crud._bump_note_stats), заполняются из notes
+CREATE TABLE IF NOT EXISTS note_stats (
+    owner_id integer PRIMARY KEY,
+    note_count integer NOT NULL DEFAULT 0,
+    last_modified timestamptz DEFAULT now()
+);
+
+-- Внешний ключ только там, где есть users: на шардах её нет (000_base_schema.sql)
+DO $$
+BEGIN
+    IF to_regclass('users') IS NOT NULL THEN
+        ALTER TABLE note_stats ADD FOREIGN KEY (owner_id) REFERENCES users(id) ON DELETE CASCADE;
+    END IF;
+END $$;
+
+-- Блокируем запись в notes на время заполнения, чтобы счётчики не разошлись
+LOCK TABLE notes IN SHARE MODE;
+
+INSERT INTO note_stats (owner_id, note_count, last_modified)
+SELECT owner_id, count(*), max(coalesce(updated_at, created_at))
+FROM notes
+WHERE owner_id IS NOT NULL
+GROUP BY owner_id
+ON CONFLICT (owner_id) DO UPDATE
+SET note_count = EXCLUDED.note_count, last_modified = EXCLUDED.last_modified;
@@ -0,0 +1,85 @@
+-- notes -> декларативные партиции по hash(owner_id).
+-- Все запросы crud.py фильтруют по owner_id, поэтому читают одну партицию;
+-- первичный ключ партиционированной таблицы обязан включать owner_id.
+-- Таблица копируется целиком под блокировкой: на очень больших таблицах
+-- переносите данные заранее (партиции + триггер/логическая репликация).
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM notes WHERE owner_id IS NULL) THEN
+        RAISE EXCEPTION 'notes with NULL owner_id must be removed before partitioning';
+    END IF;
+END $$;
+
+LOCK TABLE notes IN ACCESS EXCLUSIVE MODE;
+ALTER TABLE notes RENAME TO notes_unpartitioned;
+
+CREATE TABLE notes (LIKE notes_unpartitioned INCLUDING DEFAULTS)
+    PARTITION BY HASH (owner_id);
+ALTER TABLE notes ALTER COLUMN owner_id SET NOT NULL;
+ALTER TABLE notes ADD PRIMARY KEY (id, owner_id);
+DO $$
+BEGIN
+    -- На шардах users нет, ссылка между базами невозможна (000_base_schema.sql)
+    IF to_regclass('users') IS NOT NULL THEN
+        ALTER TABLE notes ADD FOREIGN KEY (owner_id) REFERENCES users(id);
+    END IF;
+END $$;
+CREATE INDEX ix_notes_owner_id_id ON notes (owner_id, id);
+
+-- 16 партиций; число меняется только пересозданием таблицы
+DO $$
+BEGIN
+    FOR i IN 0..15 LOOP
+        EXECUTE format(
+            'CREATE TABLE notes_p%s PARTITION OF notes FOR VALUES WITH (MODULUS 16, REMAINDER %s)',
+            lpad(i::text, 2, '0'), i
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO notes SELECT * FROM notes_unpartitioned;
+-- Последовательность id остаётся прежней и переходит к новой таблице
+ALTER SEQUENCE notes_id_seq OWNED BY notes.id;
+DROP TABLE notes_unpartitioned;
+
+-- Триггеры инвалидации кеша (002) удалились вместе со старой таблицей.
+-- Строчные триггеры партиционированной таблицы срабатывают на партициях,
+-- и TG_TABLE_NAME там notes_pNN - логическое имя передаём аргументом.
+CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS trigger AS $$
+DECLARE
+    tbl text := coalesce(TG_ARGV[0], TG_TABLE_NAME);
+BEGIN
+    IF tbl = 'notes' THEN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM pg_notify('cache_invalidation', json_build_object('t', 'notes', 'owner', NEW.owner_id)::text);
+        ELSIF TG_OP = 'UPDATE' THEN
+            PERFORM pg_notify('cache_invalidation', json_build_object('t', 'notes', 'id', NEW.id, 'owner', NEW.owner_id)::text);
+            IF OLD.owner_id IS DISTINCT FROM NEW.owner_id THEN
+                PERFORM pg_notify('cache_invalidation', json_build_object('t', 'notes', 'id', OLD.id, 'owner', OLD.owner_id)::text);
+            END IF;
+        ELSE
+            PERFORM pg_notify('cache_invalidation', json_build_object('t', 'notes', 'id', OLD.id, 'owner', OLD.owner_id)::text);
+        END IF;
+    ELSE
+        PERFORM pg_notify('cache_invalidation', json_build_object('t', tbl, 'id', OLD.id)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_cache_truncate() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('cache_invalidation', json_build_object('t', coalesce(TG_ARGV[0], TG_TABLE_NAME), 'truncate', true)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER notes_cache_invalidation
+    AFTER INSERT OR UPDATE OR DELETE ON notes
+    FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation('notes');
+CREATE TRIGGER notes_cache_truncate
+    AFTER TRUNCATE ON notes
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_cache_truncate('notes');
+
+ANALYZE notes;
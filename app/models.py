@@ -18,6 +18,20 @@ class Note(Base):
     id = Column(Integer, primary_key=True, index=True)
     text = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Растёт при каждом UPDATE (version_id_col), из него строится ETag
+    version = Column(Integer, nullable=False, server_default="1")
 
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="notes")
+
+    # (id, owner_id) как ключ маппера: UPDATE/DELETE получают owner_id в WHERE,
+    # и Postgres отсекает лишние партиции (migrations/004_partition_notes.sql)
+    __mapper_args__ = {"version_id_col": version, "primary_key": [id, owner_id]}
+
+class NoteStats(Base):
+    """Счётчики заметок владельца, обновляются в той же транзакции, что и notes"""
+    __tablename__ = "note_stats"
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    note_count = Column(Integer, nullable=False, server_default="0")
+    last_modified = Column(DateTime(timezone=True), server_default=func.now())
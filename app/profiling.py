@@ -0,0 +1,185 @@
+"""
+Профилирование запросов: разбивка времени на DB/Redis/сериализацию/handler
+для каждого запроса и семплирующий профайлер стека для выбранных запросов.
+Медленные и профилированные запросы попадают в кольцевой буфер.
+
+Стеки есть только у запросов, выбранных заранее (X-Profile или sample_rate):
+что запрос медленный, становится известно в конце, и у медленных без выбора
+в буфере только разбивка по bucket'ам.
+"""
+import hmac
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from sqlalchemy import event
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from config import settings
+
+BUCKETS = ("db", "redis", "serialization")
+
+_current: ContextVar[Optional["RequestTimings"]] = ContextVar("request_timings", default=None)
+
+# Последние медленные/профилированные запросы, читает /admin/profiles
+profiles: deque = deque(maxlen=settings.PROFILE_BUFFER_SIZE)
+
+
+class RequestTimings:
+    __slots__ = ("seconds", "calls")
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = dict.fromkeys(BUCKETS, 0.0)
+        self.calls: Dict[str, int] = dict.fromkeys(BUCKETS, 0)
+
+    def add(self, bucket: str, seconds: float):
+        self.seconds[bucket] += seconds
+        self.calls[bucket] += 1
+
+
+@contextmanager
+def timed(bucket: str):
+    """Добавляет время блока в bucket текущего запроса (если он профилируется)"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(bucket, time.perf_counter() - started)
+
+
+def install_sqlalchemy_hooks(engine):
+    """Считает время выполнения SQL в bucket "db" через события движка"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    # Время старта хранится в контексте выполнения, а не в общем стеке соединения:
+    # после упавшего execute (after_cursor_execute не вызывается) ничего не остаётся
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._profiling_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_profiling_started", None)
+        timings = _current.get()
+        if timings is not None and started is not None:
+            timings.add("db", time.perf_counter() - started)
+
+
+class SamplingProfiler:
+    """
+    Фоновый поток раз в interval снимает стек целевого потока
+    (sys._current_frames) и считает свёрнутые стеки. Одновременно работает
+    только один профайлер на процесс - остальные запросы получают только
+    разбивку по bucket'ам.
+    """
+
+    _active = threading.Lock()
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    @classmethod
+    def try_start(cls, thread_id: int, interval: float) -> Optional["SamplingProfiler"]:
+        if not cls._active.acquire(blocking=False):
+            return None
+        profiler = cls(thread_id, interval)
+        profiler._thread.start()
+        return profiler
+
+    def stop(self) -> List[dict]:
+        self._stop.set()
+        self._thread.join()
+        self._active.release()
+        return [{"stack": stack, "samples": count} for stack, count in self.stacks.most_common(30)]
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            parts = []
+            while frame is not None and len(parts) < 64:
+                code = frame.f_code
+                parts.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(parts))] += 1
+            self.samples += 1
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    def __init__(
+        self,
+        app,
+        sample_rate: float = 0.0,
+        slow_ms: float = 500,
+        header: str = "X-Profile",
+        interval_ms: float = 5,
+        header_secret: str = "",
+    ):
+        super().__init__(app)
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.header = header
+        self.interval = interval_ms / 1000
+        # Без секрета заголовок игнорируется: иначе любой клиент включает сэмплер
+        self.header_secret = header_secret
+
+    def _header_allowed(self, request: Request) -> bool:
+        value = request.headers.get(self.header)
+        if not (self.header_secret and value):
+            return False
+        # compare_digest на str падает с TypeError для не-ASCII - сравниваем байты
+        return hmac.compare_digest(value.encode("latin-1", "replace"), self.header_secret.encode())
+
+    async def dispatch(self, request: Request, call_next):
+        profile_requested = self._header_allowed(request) or (
+            self.sample_rate > 0 and random.random() < self.sample_rate
+        )
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profiler = SamplingProfiler.try_start(threading.get_ident(), self.interval) if profile_requested else None
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stacks = profiler.stop() if profiler else None
+            _current.reset(token)
+
+        breakdown = {bucket: round(timings.seconds[bucket] * 1000, 3) for bucket in BUCKETS}
+        breakdown["handler"] = round(max(elapsed_ms - sum(breakdown.values()), 0.0), 3)
+
+        if profile_requested or elapsed_ms >= self.slow_ms:
+            profiles.append({
+                "ts": time.time(),
+                "method": request.method,
+                "path": request.url.path,
+                "status": response.status_code,
+                "duration_ms": round(elapsed_ms, 3),
+                "breakdown_ms": breakdown,
+                "calls": dict(timings.calls),
+                "slow": elapsed_ms >= self.slow_ms,
+                "samples": profiler.samples if profiler else 0,
+                "stacks": stacks,
+            })
+
+        if profile_requested:
+            response.headers["Server-Timing"] = ", ".join(
+                f"{name};dur={value}" for name, value in breakdown.items()
+            )
+        return response
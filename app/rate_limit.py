@@ -0,0 +1,171 @@
+"""
+Распределённый rate limiting в Redis: token bucket, одна атомарная
+проверка = один вызов Lua скрипта (EVALSHA). Политики задаются строкой
+"<запросов>/<секунд>", ключ строится по пользователю, IP или маршруту.
+
+Если Redis недоступен (breaker CacheManager открыт) - лимиты не
+применяются, от перегрузки тогда защищает admission.ConcurrencyLimitMiddleware.
+"""
+import logging
+from typing import NamedTuple, Optional
+
+from fastapi import Depends, HTTPException, Request, status
+
+from config import settings
+from dependencies import get_current_user
+from models import User
+from redis_client import get_cache_manager
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] - ключ bucket'а; ARGV: ёмкость, пополнение в секунду, стоимость запроса.
+# Время берём из Redis (TIME), чтобы расхождение часов между подами не влияло.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate / 1000)
+local allowed = 0
+local retry_ms = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_ms = math.ceil((cost - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+return {allowed, math.floor(tokens), retry_ms}
+"""
+
+# Счётчики для /metrics
+stats = {"checks_total": 0, "rejected_total": 0}
+
+
+class RateLimitPolicy(NamedTuple):
+    name: str
+    capacity: int
+    refill_per_second: float
+
+    @classmethod
+    def parse(cls, name: str, spec: str) -> "RateLimitPolicy":
+        """"120/60" -> 120 запросов за 60 секунд (bucket ёмкостью 120)"""
+        requests, seconds = spec.split("/")
+        return cls(name, int(requests), int(requests) / float(seconds))
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after_ms: int
+
+
+class RateLimiter:
+    def __init__(self, cache_manager):
+        self.cache_manager = cache_manager
+        self._script = None
+        self._script_client = None
+
+    def _get_script(self):
+        # Скрипт привязан к клиенту, а клиент создаётся в lifespan
+        if self._script_client is not self.cache_manager.redis:
+            self._script = self.cache_manager.redis.register_script(TOKEN_BUCKET_LUA)
+            self._script_client = self.cache_manager.redis
+        return self._script
+
+    async def check(self, key: str, policy: RateLimitPolicy, cost: int = 1) -> RateLimitResult:
+        stats["checks_total"] += 1
+        result = await self.cache_manager.run(
+            "rate_limit",
+            lambda: self._get_script()(keys=[key], args=[policy.capacity, policy.refill_per_second, cost]),
+        )
+        if result is None:
+            # fail-open: без Redis не отказываем
+            return RateLimitResult(True, policy.capacity, 0)
+        allowed, remaining, retry_ms = (int(v) for v in result)
+        if not allowed:
+            stats["rejected_total"] += 1
+        return RateLimitResult(bool(allowed), remaining, retry_ms)
+
+
+def client_ip(request: Request) -> str:
+    """
+    IP клиента. Левые записи X-Forwarded-For присылает сам клиент - берём ту,
+    что дописал внешний из FORWARDED_TRUSTED_HOPS наших прокси (считая справа)
+    """
+    if settings.TRUST_FORWARDED_FOR:
+        forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",")]
+        forwarded = [part for part in forwarded if part]
+        if forwarded:
+            return forwarded[max(len(forwarded) - settings.FORWARDED_TRUSTED_HOPS, 0)]
+    return request.client.host if request.client else "unknown"
+
+
+# Один limiter на процесс: SHA скрипта регистрируется один раз, а не на каждый запрос
+_limiter: Optional[RateLimiter] = None
+
+
+def _get_limiter(cache_manager) -> RateLimiter:
+    global _limiter
+    if _limiter is None or _limiter.cache_manager is not cache_manager:
+        _limiter = RateLimiter(cache_manager)
+    return _limiter
+
+
+async def _enforce(request: Request, key: str, policy: RateLimitPolicy, cache_manager):
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    result = await _get_limiter(cache_manager).check(key, policy)
+    if not result.allowed:
+        retry_after = max(1, -(-result.retry_after_ms // 1000))
+        logger.info("Rate limit %s exceeded for %s", policy.name, key, extra={"event": "rate_limited"})
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={
+                "Retry-After": str(retry_after),
+                "X-RateLimit-Limit": str(policy.capacity),
+                "X-RateLimit-Remaining": "0",
+            },
+        )
+
+
+def _route(request: Request) -> str:
+    route = request.scope.get("route")
+    return getattr(route, "path", request.url.path)
+
+
+def limit_by_user(policy: RateLimitPolicy):
+    """Лимит на пользователя для маршрута"""
+    async def dependency(
+        request: Request,
+        current_user: User = Depends(get_current_user),
+        cache_manager = Depends(get_cache_manager),
+    ):
+        await _enforce(request, f"rl:{policy.name}:user:{current_user.id}", policy, cache_manager)
+    return dependency
+
+
+def limit_by_ip(policy: RateLimitPolicy):
+    """Лимит на IP клиента для маршрута"""
+    async def dependency(request: Request, cache_manager = Depends(get_cache_manager)):
+        await _enforce(request, f"rl:{policy.name}:ip:{client_ip(request)}", policy, cache_manager)
+    return dependency
+
+
+def limit_route(policy: RateLimitPolicy):
+    """Общий лимит маршрута на все поды и всех клиентов"""
+    async def dependency(request: Request, cache_manager = Depends(get_cache_manager)):
+        await _enforce(request, f"rl:{policy.name}:route:{request.method}:{_route(request)}", policy, cache_manager)
+    return dependency
+
+
+NOTES_READ_PER_USER = RateLimitPolicy.parse("notes_read", settings.RATE_LIMIT_NOTES_READ_PER_USER)
+NOTES_WRITE_PER_USER = RateLimitPolicy.parse("notes_write", settings.RATE_LIMIT_NOTES_WRITE_PER_USER)
+TASKS_PER_IP = RateLimitPolicy.parse("tasks_ip", settings.RATE_LIMIT_TASKS_PER_IP)
+TASKS_PER_ROUTE = RateLimitPolicy.parse("tasks_route", settings.RATE_LIMIT_TASKS_PER_ROUTE)
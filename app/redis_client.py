@@ -1,88 +1,395 @@
 
+import asyncio
 import redis.asyncio as redis
 import json
-from typing import Optional, Any
+import time
+from typing import Optional, Any, Awaitable, Callable, Dict, List, Tuple
 import logging
 from config import settings
+from profiling import timed
+from circuit_breaker import CircuitBreaker, CLOSED
+from cache_keys import compressed_key
+import compression
 
-
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-redis_client = redis.Redis.from_url(
-    settings.REDIS_URL, 
-    decode_responses=True,
-    socket_connect_timeout=5,
-    socket_timeout=5,
-    retry_on_timeout=True
-)
+# Недоступность Redis - только эти ошибки считаются отказами breaker'а.
+# Ошибки данных (битый JSON, ошибка Lua скрипта) - проблема одного запроса,
+# они не должны выключать кеш для всех.
+OUTAGE_ERRORS = (redis.ConnectionError, redis.TimeoutError, asyncio.TimeoutError)
+
+# Клиент создаётся в lifespan приложения (init_redis), а не при импорте
+redis_client: Optional[redis.Redis] = None
+# Тот же Redis без decode_responses - для предсжатых вариантов (байты)
+binary_client: Optional[redis.Redis] = None
+
+# Что чистим после восстановления, если пропущенных инвалидаций было слишком много
+RECOVERY_FLUSH_PATTERNS = ("note:*", "user_notes:*", "user_notes_ver:*", "cache:*", "zvar:*")
+MAX_PENDING_INVALIDATIONS = 1000
+
+# Атомарно: члены SET индекса и сам индекс; запись между SMEMBERS и UNLINK не теряется
+DELETE_INDEX_LUA = """
+local keys = redis.call('SMEMBERS', KEYS[1])
+local deleted = 0
+for i = 1, #keys, 500 do
+    deleted = deleted + redis.call('UNLINK', unpack(keys, i, math.min(i + 499, #keys)))
+end
+redis.call('UNLINK', KEYS[1])
+return deleted
+"""
 
 async def get_redis() -> redis.Redis:
     return redis_client
 
 class CacheManager:
-    def __init__(self, redis_client: redis.Redis):
+    def __init__(self, redis_client: redis.Redis, binary_client: redis.Redis = None):
         self.redis = redis_client
+        self.binary = binary_client
+        self.variant_encodings = [
+            e for e in settings.COMPRESSION_ENCODINGS if e in compression.available_encodings()
+        ] if settings.COMPRESSION_ENABLED else []
         self.default_ttl = settings.CACHE_TTL
-    
-    async def get(self, key: str) -> Optional[Any]:
-        """Получить данные из кеша"""
-        try:
-            cached_data = await self.redis.get(key)
-            if cached_data:
-                logger.info(f"📦 Cache HIT for key: {key}")
-                return json.loads(cached_data)
-            logger.info(f"❌ Cache MISS for key: {key}")
-            return None
-        except Exception as e:
-            logger.error(f"Error getting from cache: {e}")
-            return None
-    
-    async def set(self, key: str, data: Any, ttl: int = None) -> bool:
-        """Сохранить данные в кеш"""
+        self.op_timeout = settings.REDIS_OP_TIMEOUT_MS / 1000
+        self.breaker = CircuitBreaker(
+            "redis",
+            failure_threshold=settings.REDIS_BREAKER_FAILURES,
+            reset_timeout=settings.REDIS_BREAKER_RESET_SECONDS,
+        )
+        # Неудавшиеся инвалидации (таймаут или открытый breaker): ключ/паттерн -> операция
+        self._pending: Dict[str, str] = {}
+        self._pending_overflow = False
+        self._replay_task: Optional[asyncio.Task] = None
+
+    async def _available(self) -> bool:
+        """Закрыт ли breaker; при истёкшем reset_timeout - пробует health_check"""
+        if self.redis is None:
+            return False
+        if self.breaker.allow():
+            return True
+        if not self.breaker.try_probe():
+            return False
         try:
-            ttl = ttl or self.default_ttl
-            await self.redis.set(key, json.dumps(data), ex=ttl)
-            logger.info(f"💾 Cached data for key: {key} with TTL: {ttl}s")
+            healthy = await self.health_check()
+        except BaseException:
+            # Проба отменена (клиент отключился): без этого breaker навсегда остался бы half_open
+            self.breaker.record_failure()
+            raise
+        if healthy:
+            self.breaker.record_success()
+            self._schedule_replay()
             return True
+        self.breaker.record_failure()
+        return False
+
+    async def run(self, op: str, call: Callable[[], Awaitable[Any]], default: Any = None, timeout: float = None) -> Any:
+        """Выполняет операцию с таймаутом; при открытом breaker сразу возвращает default"""
+        if not await self._available():
+            return default
+        try:
+            with timed("redis"):
+                result = await asyncio.wait_for(call(), timeout or self.op_timeout)
+        except OUTAGE_ERRORS as e:
+            self.breaker.record_failure()
+            logger.error("Error in cache %s: %r", op, e)
+            return default
         except Exception as e:
-            logger.error(f"Error setting cache: {e}")
+            logger.error("Unexpected error in cache %s: %r", op, e)
+            return default
+        self.breaker.record_success()
+        self._schedule_replay()
+        return result
+
+    def _defer(self, op: str, key: str):
+        if len(self._pending) >= MAX_PENDING_INVALIDATIONS:
+            self._pending_overflow = True
+        else:
+            self._pending[key] = op
+
+    def _schedule_replay(self):
+        """
+        После любой успешной операции применяет отложенные инвалидации в фоне:
+        одиночный таймаут не открывает breaker, но без повтора версия коллекции
+        (ключ без TTL) так и осталась бы старой
+        """
+        if not self._pending and not self._pending_overflow:
+            return
+        if self._replay_task is not None and not self._replay_task.done():
+            return
+        self._replay_task = asyncio.create_task(self._replay_pending())
+
+    async def _replay_pending(self):
+        """Применяет инвалидации, не выполненные из-за ошибок или недоступности Redis"""
+        pending, self._pending = self._pending, {}
+        overflow, self._pending_overflow = self._pending_overflow, False
+        if not pending and not overflow:
+            return
+        logger.warning("Replaying %d cache invalidations (overflow=%s)", len(pending), overflow)
+
+        async def call():
+            if overflow:
+                for pattern in RECOVERY_FLUSH_PATTERNS:
+                    await self._delete_pattern(pattern)
+                return True
+            for key, op in pending.items():
+                if op == "pattern":
+                    await self._delete_pattern(key)
+                elif op == "index":
+                    await self._delete_index(key)
+                elif op == "bump":
+                    await self._bump_version(key)
+                else:
+                    await self.redis.unlink(key)
+            return True
+
+        # SCAN по всему keyspace - лимит как у delete_pattern, а не обычный op_timeout
+        if await self.run("replay_pending", call, timeout=settings.REDIS_SCAN_TIMEOUT_MS / 1000) is None:
+            # Не получилось - возвращаем в очередь до следующей успешной операции
+            for key, op in pending.items():
+                if key not in self._pending:
+                    self._defer(op, key)
+            self._pending_overflow = self._pending_overflow or overflow
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Получить данные из кеша"""
+        cached_data = await self.run("get", lambda: self.redis.get(key))
+        if cached_data:
+            logger.info("📦 Cache HIT for key: %s", key, extra={"event": "cache_hit"})
+            with timed("serialization"):
+                return json.loads(cached_data)
+        logger.info("❌ Cache MISS for key: %s", key, extra={"event": "cache_miss"})
+        return None
+
+    @staticmethod
+    def _add_to_index(pipe, index: Optional[str], keys: List[str], ttl: int):
+        # Все ключи одного индекса пишутся с одним TTL: последний EXPIRE переживает их всех
+        if index:
+            pipe.sadd(index, *keys)
+            pipe.expire(index, ttl)
+
+    async def set(self, key: str, data: Any, ttl: int = None, precompress: bool = False, index: str = None) -> bool:
+        """
+        Сохранить данные в кеш; precompress - вместе со сжатыми вариантами,
+        index - SET, по которому delete_index удалит ключ
+        """
+        if self.breaker.state != CLOSED:
             return False
-    
+        ttl = ttl or self.default_ttl
+        with timed("serialization"):
+            payload = json.dumps(data)
+        if precompress and self.binary is not None and len(payload) >= settings.COMPRESSION_MIN_SIZE:
+            return await self._set_with_variants(key, payload.encode(), ttl, index)
+
+        async def call():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(key, payload, ex=ttl)
+                self._add_to_index(pipe, index, [key], ttl)
+                return (await pipe.execute())[0]
+
+        ok = await self.run("set", call, False)
+        if ok:
+            logger.debug("💾 Cached data for key: %s with TTL: %ss", key, ttl)
+        return bool(ok)
+
+    async def _set_with_variants(self, key: str, payload: bytes, ttl: int, index: str = None) -> bool:
+        # Сжимаем один раз при записи, а не на каждом попадании в кеш
+        with timed("serialization"):
+            variants = {compressed_key(key, e): compression.compress(payload, e) for e in self.variant_encodings}
+
+        async def call():
+            async with self.binary.pipeline(transaction=False) as pipe:
+                pipe.set(key, payload, ex=ttl)
+                for variant_key, body in variants.items():
+                    pipe.set(variant_key, body, ex=ttl)
+                self._add_to_index(pipe, index, [key, *variants], ttl)
+                return await pipe.execute()
+
+        ok = await self.run("set_with_variants", call, None) is not None
+        if ok:
+            logger.debug("💾 Cached data for key: %s with %d compressed variants", key, len(variants))
+        return ok
+
+    async def get_variant(self, key: str, encoding: Optional[str]) -> Tuple[Optional[bytes], Any]:
+        """
+        (сжатое тело, None), если в кеше есть вариант encoding;
+        иначе (None, данные или None) как get(). Один MGET на оба ключа.
+        """
+        if self.binary is None or encoding not in self.variant_encodings:
+            return None, await self.get(key)
+        values = await self.run("get_variant", lambda: self.binary.mget(key, compressed_key(key, encoding)))
+        raw, body = values if values else (None, None)
+        if body:
+            logger.info("📦 Cache HIT for key: %s (%s)", key, encoding, extra={"event": "cache_hit"})
+            return body, None
+        if raw:
+            logger.info("📦 Cache HIT for key: %s", key, extra={"event": "cache_hit"})
+            with timed("serialization"):
+                return None, json.loads(raw)
+        logger.info("❌ Cache MISS for key: %s", key, extra={"event": "cache_miss"})
+        return None, None
+
+    async def set_many(self, items: Dict[str, Any], ttl: int = None, indexes: Dict[str, str] = None) -> bool:
+        """Сохранить несколько ключей одним pipeline; indexes - ключ -> SET индекса"""
+        if self.breaker.state != CLOSED:
+            return False
+        ttl = ttl or self.default_ttl
+        with timed("serialization"):
+            payloads = {key: json.dumps(data) for key, data in items.items()}
+
+        async def call():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, payload in payloads.items():
+                    pipe.set(key, payload, ex=ttl)
+                    self._add_to_index(pipe, (indexes or {}).get(key), [key], ttl)
+                return await pipe.execute()
+
+        ok = await self.run("set_many", call, None) is not None
+        if ok:
+            logger.debug("💾 Cached %d keys with TTL: %ss", len(payloads), ttl)
+        return ok
+
+    async def missing(self, keys: List[str]) -> List[str]:
+        """Ключи из списка, которых нет в кеше (один pipeline EXISTS)"""
+        async def call():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.exists(key)
+                return await pipe.execute()
+
+        found = await self.run("missing", call)
+        if found is None:
+            return list(keys)
+        return [key for key, exists in zip(keys, found) if not exists]
+
+    def _with_variants(self, keys: List[str]) -> List[str]:
+        return [*keys, *(compressed_key(key, e) for key in keys for e in self.variant_encodings)]
+
     async def delete(self, key: str) -> bool:
-        """Удалить данные из кеша"""
-        try:
-            await self.redis.delete(key)
-            logger.info(f"🗑️ Deleted cache key: {key}")
+        """Удалить данные из кеша (вместе со сжатыми вариантами)"""
+        keys = self._with_variants([key])
+        if await self.run("delete", lambda: self.redis.unlink(*keys)) is None:
+            for deferred in keys:
+                self._defer("delete", deferred)
+            return False
+        logger.debug("🗑️ Deleted cache key: %s", key)
+        return True
+
+    async def _delete_pattern(self, pattern: str) -> int:
+        # SCAN вместо KEYS: не блокирует Redis на всё пространство ключей
+        deleted = 0
+        batch = []
+        async for key in self.redis.scan_iter(match=pattern, count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                deleted += await self.redis.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += await self.redis.unlink(*batch)
+        return deleted
+
+    async def delete_many(self, keys: List[str]) -> bool:
+        """Удалить несколько ключей одной командой"""
+        if not keys:
             return True
-        except Exception as e:
-            logger.error(f"Error deleting from cache: {e}")
+        keys = self._with_variants(keys)
+        if await self.run("delete_many", lambda: self.redis.unlink(*keys)) is None:
+            for key in keys:
+                self._defer("delete", key)
             return False
-    
+        logger.debug("🗑️ Deleted %d cache keys", len(keys))
+        return True
+
     async def delete_pattern(self, pattern: str) -> bool:
         """Удалить все ключи по паттерну"""
-        try:
-            keys = await self.redis.keys(pattern)
-            if keys:
-                await self.redis.delete(*keys)
-                logger.info(f"🗑️ Deleted {len(keys)} cache keys with pattern: {pattern}")
-            return True
-        except Exception as e:
-            logger.error(f"Error deleting pattern from cache: {e}")
+        # SCAN - несколько round-trip'ов, лимит времени больше обычного
+        deleted = await self.run("delete_pattern", lambda: self._delete_pattern(pattern), timeout=settings.REDIS_SCAN_TIMEOUT_MS / 1000)
+        if deleted is None:
+            self._defer("pattern", pattern)
             return False
-    
+        logger.debug("🗑️ Deleted %d cache keys with pattern: %s", deleted, pattern)
+        return True
+
+    async def _delete_index(self, index: str) -> int:
+        return await self.redis.eval(DELETE_INDEX_LUA, 1, index)
+
+    async def delete_index(self, index: str) -> bool:
+        """Удалить ключи, записанные с index=..., и сам индекс - O(число ключей индекса)"""
+        deleted = await self.run("delete_index", lambda: self._delete_index(index))
+        if deleted is None:
+            self._defer("index", index)
+            return False
+        logger.debug("🗑️ Deleted %d cache keys from index: %s", deleted, index)
+        return True
+
+    async def get_version(self, key: str) -> Optional[int]:
+        """
+        Текущая версия (для ETag). Отсутствующий ключ инициализируется
+        временем в мс, чтобы после потери ключа версии не повторялись.
+        """
+        async def call():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(key, int(time.time() * 1000), nx=True)
+                pipe.get(key)
+                _, value = await pipe.execute()
+            return int(value)
+
+        return await self.run("get_version", call)
+
+    async def _bump_version(self, key: str) -> int:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(key, int(time.time() * 1000), nx=True)
+            pipe.incr(key)
+            _, value = await pipe.execute()
+        return int(value)
+
+    async def bump_version(self, key: str) -> Optional[int]:
+        """Увеличить версию после записи"""
+        value = await self.run("bump_version", lambda: self._bump_version(key))
+        if value is None:
+            self._defer("bump", key)
+        return value
+
     async def health_check(self) -> bool:
         """Проверка здоровья Redis"""
         try:
-            await self.redis.ping()
+            await asyncio.wait_for(self.redis.ping(), self.op_timeout)
             return True
         except Exception as e:
-            logger.error(f"Redis health check failed: {e}")
+            logger.error("Redis health check failed: %r", e)
             return False
 
-# Создаем глобальный экземпляр CacheManager
-cache_manager = CacheManager(redis_client)
+# Создаем глобальный экземпляр CacheManager, клиент подключается в init_redis
+cache_manager = CacheManager(None)
 
 async def get_cache_manager() -> CacheManager:
     return cache_manager
 
+def _create_client(decode_responses: bool) -> redis.Redis:
+    # Таймауты сокета - страховка; основной лимит - REDIS_OP_TIMEOUT_MS в CacheManager
+    return redis.Redis.from_url(
+        settings.REDIS_URL,
+        decode_responses=decode_responses,
+        socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        retry_on_timeout=False
+    )
+
+async def init_redis() -> redis.Redis:
+    """Создаёт клиенты Redis и открывает первое соединение"""
+    global redis_client, binary_client
+    if redis_client is None:
+        redis_client = _create_client(decode_responses=True)
+        binary_client = _create_client(decode_responses=False)
+        cache_manager.redis = redis_client
+        cache_manager.binary = binary_client
+    await cache_manager.health_check()
+    return redis_client
+
+async def close_redis():
+    global redis_client, binary_client
+    if redis_client is not None:
+        await redis_client.aclose()
+        await binary_client.aclose()
+        redis_client = None
+        binary_client = None
+        cache_manager.redis = None
+        cache_manager.binary = None
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends, Query
+from dependencies import require_role
+from models import User
+import profiling
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+@router.get("/profiles")
+async def list_profiles(
+    limit: int = Query(20, ge=1, le=1000),
+    slow_only: bool = False,
+    current_user: User = Depends(require_role("admin"))
+):
+    """
+    Последние медленные/профилированные запросы из кольцевого буфера
+    """
+    items = [p for p in profiling.profiles if p["slow"] or not slow_only]
+    return {"count": len(items), "profiles": list(reversed(items))[:limit]}
+
+@router.delete("/profiles")
+async def clear_profiles(current_user: User = Depends(require_role("admin"))):
+    """
+    Очистка буфера профилей
+    """
+    profiling.profiles.clear()
+    return {"message": "Profiles cleared"}
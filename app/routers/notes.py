@@ -1,132 +1,276 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from schemas.note import NoteCreate, NoteUpdate, NoteOut
-from crud import create_note, get_notes, get_note, update_note, delete_note
-from dependencies import get_current_user, get_db
+from sqlalchemy.orm.exc import StaleDataError
+from schemas.note import NoteCreate, NoteUpdate, NoteOut, NoteStatsOut
+from crud import create_note, get_notes, get_note, update_note, delete_note, get_note_stats
+from dependencies import get_current_user, get_notes_db
 from models import User
 from redis_client import get_cache_manager
+from profiling import timed
+from cache_keys import note_key, user_notes_key, user_notes_index_key, user_notes_stats_key, user_notes_version_key, NOTE_TTL, NOTES_LIST_TTL
+from etags import note_etag, collection_etag, if_none_match
+from cache_warmup import hot_keys
+from compression import choose_encoding, weak_etag
+from rate_limit import limit_by_user, NOTES_READ_PER_USER, NOTES_WRITE_PER_USER
+from routers.tasks import TaskResponse
+from idempotency import Idempotency
+import bulk
 import json
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/notes", tags=["notes"])
 
-@router.post("/", response_model=NoteOut)
+def serialize_note(note) -> dict:
+    """ORM-объект заметки -> JSON-совместимый dict для кеша и ответа"""
+    with timed("serialization"):
+        return NoteOut.model_validate(note).model_dump(mode="json")
+
+async def load_note_stats(user_id: int, db: AsyncSession, cache_manager) -> dict:
+    """Счётчики владельца: Redis, иначе одна строка note_stats по первичному ключу"""
+    cache_key = user_notes_stats_key(user_id)
+    cached = await cache_manager.get(cache_key)
+    if cached:
+        return cached
+    stats = NoteStatsOut.model_validate(await get_note_stats(user_id, db)).model_dump(mode="json")
+    await cache_manager.set(cache_key, stats, ttl=NOTES_LIST_TTL, index=user_notes_index_key(user_id))
+    return stats
+
+@router.post("/", response_model=NoteOut, dependencies=[Depends(limit_by_user(NOTES_WRITE_PER_USER))])
 async def create(
     user_note: NoteCreate, 
-    db: AsyncSession = Depends(get_db), 
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_notes_db), 
     current_user: User = Depends(get_current_user),
     cache_manager = Depends(get_cache_manager)
 ):
-    """Создание новой заметки с инвалидацией кеша"""
-    note = await create_note(user_note, current_user.id, db)
-    
-    # Инвалидируем кеш для заметок пользователя
-    await cache_manager.delete_pattern(f"user_notes:{current_user.id}:*")
-    await cache_manager.delete_pattern("notes:all:*")
-    
-    logger.info(f"📝 Created note {note.id} for user {current_user.id}")
-    return note
+    """Создание новой заметки с инвалидацией кеша; повтор с тем же Idempotency-Key не создаёт дубликат"""
+    async with Idempotency(request, f"notes:{current_user.id}", user_note, cache_manager) as idem:
+        if idem.replay:
+            return idem.replay
+
+        note = await create_note(user_note, current_user.id, db)
+        
+        # Инвалидируем кеш для заметок пользователя
+        await cache_manager.delete_index(user_notes_index_key(current_user.id))
+        await cache_manager.bump_version(user_notes_version_key(current_user.id))
+        
+        etag = note_etag(note.id, note.version)
+        response.headers["ETag"] = etag
+        note_data = serialize_note(note)
+        idem.store(note_data, headers={"ETag": etag})
+    logger.info("📝 Created note %s for user %s", note.id, current_user.id)
+    return note_data
 
 from typing import Optional
 from fastapi import Query
 
-@router.get("/", response_model=list[NoteOut])
+@router.get("/", response_model=list[NoteOut], dependencies=[Depends(limit_by_user(NOTES_READ_PER_USER))])
 async def read_notes(
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_notes_db),
     current_user: User = Depends(get_current_user),
     skip: int = Query(0, ge=0),
     limit: int = Query(10, le=100),
     search: Optional[str] = "",
     cache_manager = Depends(get_cache_manager)
 ):
-    """Получение списка заметок с кешированием"""
+    """Получение списка заметок с кешированием и ETag по версии коллекции"""
+    # Если версия коллекции не изменилась - тело не нужно ни из кеша, ни из БД
+    version = await cache_manager.get_version(user_notes_version_key(current_user.id))
+    etag = collection_etag(current_user.id, version, skip, limit, search)
+    if if_none_match(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    headers = {}
+    if etag:
+        headers["ETag"] = etag
+    if not search:
+        # С поиском общее число заметок не совпадает с числом найденных
+        stats = await load_note_stats(current_user.id, db, cache_manager)
+        headers["X-Total-Count"] = str(stats["note_count"])
+    response.headers.update(headers)
+
     # Генерируем ключ кеша
-    cache_key = f"user_notes:{current_user.id}:{skip}:{limit}:{search}"
+    cache_key = user_notes_key(current_user.id, skip, limit, search)
+    hot_keys.record(cache_key)
     
-    # Проверяем кеш
-    cached_notes = await cache_manager.get(cache_key)
+    # Проверяем кеш: если есть предсжатый вариант - отдаём байты без сериализации и сжатия
+    encoding = choose_encoding(request.headers.get("accept-encoding"), cache_manager.variant_encodings)
+    compressed, cached_notes = await cache_manager.get_variant(cache_key, encoding)
+    if compressed:
+        headers.update({"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+        if etag:
+            headers["ETag"] = weak_etag(etag)
+        return Response(content=compressed, media_type="application/json", headers=headers)
     if cached_notes:
-        logger.info(f"📦 Returning cached notes for user {current_user.id}")
+        logger.debug("📦 Returning cached notes for user %s", current_user.id)
         return cached_notes
     
     # Получаем данные из БД
     notes = await get_notes(current_user.id, db, skip=skip, limit=limit, search=search)
     
     # Сериализуем для кеширования
-    notes_data = [note.model_dump() for note in notes]
+    notes_data = [serialize_note(note) for note in notes]
     
     # Кешируем результат (TTL: 5 минут)
-    await cache_manager.set(cache_key, notes_data, ttl=300)
+    await cache_manager.set(
+        cache_key, notes_data, ttl=NOTES_LIST_TTL, precompress=True, index=user_notes_index_key(current_user.id)
+    )
     
-    logger.info(f"💾 Cached notes for user {current_user.id}")
+    logger.debug("💾 Cached notes for user %s", current_user.id)
     return notes_data
 
-@router.get("/{note_id}", response_model=NoteOut)
+@router.get("/stats", response_model=NoteStatsOut, dependencies=[Depends(limit_by_user(NOTES_READ_PER_USER))])
+async def read_stats(
+    db: AsyncSession = Depends(get_notes_db),
+    current_user: User = Depends(get_current_user),
+    cache_manager = Depends(get_cache_manager)
+):
+    """Количество заметок пользователя и время последнего изменения"""
+    return await load_note_stats(current_user.id, db, cache_manager)
+
+def _bulk_format(format: str = Query("ndjson", pattern="^(ndjson|csv)$")) -> str:
+    return format
+
+@router.get("/export", dependencies=[Depends(limit_by_user(NOTES_READ_PER_USER))])
+async def export_notes(
+    fmt: str = Depends(_bulk_format),
+    current_user: User = Depends(get_current_user)
+):
+    """Все заметки пользователя потоком NDJSON или CSV (COPY, память ограничена)"""
+    if not bulk.supports_copy(current_user.id):
+        raise HTTPException(status_code=501, detail="Bulk export requires PostgreSQL")
+    logger.info("📤 Exporting notes for user %s as %s", current_user.id, fmt)
+    return StreamingResponse(
+        bulk.stream_export(current_user.id, fmt),
+        media_type=bulk.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="notes.{fmt}"'},
+    )
+
+@router.post("/import", response_model=TaskResponse, status_code=202, dependencies=[Depends(limit_by_user(NOTES_WRITE_PER_USER))])
+async def import_notes(
+    request: Request,
+    fmt: str = Depends(_bulk_format),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Тело запроса (NDJSON или CSV с колонкой text) сохраняется в файл,
+    загрузку в БД делает Celery задача - статус в /tasks/status/{task_id}
+    """
+    if not bulk.supports_copy(current_user.id):
+        raise HTTPException(status_code=501, detail="Bulk import requires PostgreSQL")
+    try:
+        path = await bulk.spool_upload(request.stream(), fmt)
+    except bulk.ImportTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    from tasks import import_notes_task
+
+    try:
+        task = import_notes_task.delay(path, current_user.id, fmt)
+    except Exception as e:
+        os.remove(path)
+        raise HTTPException(status_code=500, detail=f"Ошибка запуска задачи: {str(e)}")
+    logger.info("📥 Queued import %s for user %s", task.id, current_user.id)
+    return TaskResponse(task_id=task.id, status="PENDING", message="Импорт заметок запущен")
+
+@router.get("/{note_id}", response_model=NoteOut, dependencies=[Depends(limit_by_user(NOTES_READ_PER_USER))])
 async def read_note(
     note_id: int, 
-    db: AsyncSession = Depends(get_db), 
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_notes_db), 
     current_user: User = Depends(get_current_user),
     cache_manager = Depends(get_cache_manager)
 ):
     """Получение конкретной заметки с кешированием"""
     # Генерируем ключ кеша
-    cache_key = f"note:{note_id}:user:{current_user.id}"
+    cache_key = note_key(note_id, current_user.id)
+    hot_keys.record(cache_key)
     
     # Проверяем кеш
     cached_note = await cache_manager.get(cache_key)
     if cached_note:
-        logger.info(f"📦 Returning cached note {note_id} for user {current_user.id}")
+        etag = note_etag(note_id, cached_note.get("version"))
+        if if_none_match(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        if etag:
+            response.headers["ETag"] = etag
+        logger.debug("📦 Returning cached note %s for user %s", note_id, current_user.id)
         return cached_note
     
     # Получаем из БД
     note = await get_note(note_id, current_user.id, db)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
+
+    # ETag считаем до сериализации: при совпадении тело не строим
+    etag = note_etag(note.id, note.version)
+    if if_none_match(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     
     # Кешируем результат
-    note_data = note.model_dump()
-    await cache_manager.set(cache_key, note_data, ttl=600)  # 10 минут для отдельных заметок
+    note_data = serialize_note(note)
+    await cache_manager.set(cache_key, note_data, ttl=NOTE_TTL)
     
-    logger.info(f"💾 Cached note {note_id} for user {current_user.id}")
+    logger.debug("💾 Cached note %s for user %s", note_id, current_user.id)
     return note_data
 
-@router.put("/{note_id}", response_model=NoteOut)
+@router.put("/{note_id}", response_model=NoteOut, dependencies=[Depends(limit_by_user(NOTES_WRITE_PER_USER))])
 async def update(
     note_id: int, 
     updated: NoteUpdate, 
-    db: AsyncSession = Depends(get_db), 
+    response: Response,
+    db: AsyncSession = Depends(get_notes_db), 
     current_user: User = Depends(get_current_user),
     cache_manager = Depends(get_cache_manager)
 ):
     """Обновление заметки с инвалидацией кеша"""
-    note = await update_note(note_id, current_user.id, updated, db)
+    try:
+        note = await update_note(note_id, current_user.id, updated, db)
+    except StaleDataError:
+        # Параллельное обновление той же заметки увеличило version раньше нас
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Note was modified concurrently")
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
     # Инвалидируем кеш
-    await cache_manager.delete(f"note:{note_id}:user:{current_user.id}")
-    await cache_manager.delete_pattern(f"user_notes:{current_user.id}:*")
+    await cache_manager.delete(note_key(note_id, current_user.id))
+    await cache_manager.delete_index(user_notes_index_key(current_user.id))
+    await cache_manager.bump_version(user_notes_version_key(current_user.id))
     
-    logger.info(f"✏️ Updated note {note_id} for user {current_user.id}")
+    response.headers["ETag"] = note_etag(note.id, note.version)
+    logger.info("✏️ Updated note %s for user %s", note_id, current_user.id)
     return note
 
-@router.delete("/{note_id}")
+@router.delete("/{note_id}", dependencies=[Depends(limit_by_user(NOTES_WRITE_PER_USER))])
 async def delete(
     note_id: int, 
-    db: AsyncSession = Depends(get_db), 
+    db: AsyncSession = Depends(get_notes_db), 
     current_user: User = Depends(get_current_user),
     cache_manager = Depends(get_cache_manager)
 ):
     """Удаление заметки с инвалидацией кеша"""
-    note = await delete_note(note_id, current_user.id, db)
+    try:
+        note = await delete_note(note_id, current_user.id, db)
+    except StaleDataError:
+        # DELETE тоже проверяет version: заметку успели изменить или удалить
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Note was modified concurrently")
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
     # Инвалидируем кеш
-    await cache_manager.delete(f"note:{note_id}:user:{current_user.id}")
-    await cache_manager.delete_pattern(f"user_notes:{current_user.id}:*")
+    await cache_manager.delete(note_key(note_id, current_user.id))
+    await cache_manager.delete_index(user_notes_index_key(current_user.id))
+    await cache_manager.bump_version(user_notes_version_key(current_user.id))
     
-    logger.info(f"🗑️ Deleted note {note_id} for user {current_user.id}")
+    logger.info("🗑️ Deleted note %s for user %s", note_id, current_user.id)
     return {"message": "Note deleted"}
@@ -1,13 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 from typing import Dict, Any
-from tasks import send_email_task, process_data_task, cleanup_task
-from celery.result import AsyncResult
 from dependencies import get_current_user
 from models import User
+from redis_client import get_cache_manager
+from idempotency import Idempotency
+from rate_limit import client_ip, limit_by_ip, limit_route, TASKS_PER_IP, TASKS_PER_ROUTE
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
+# Постановка задач: лимит на IP и общий лимит маршрута, чтобы не залить брокер
+enqueue_limits = [Depends(limit_by_ip(TASKS_PER_IP)), Depends(limit_route(TASKS_PER_ROUTE))]
+
 class EmailRequest(BaseModel):
     email: str
     subject: str
@@ -21,31 +25,42 @@ class TaskResponse(BaseModel):
     status: str
     message: str
 
-@router.post("/send-email", response_model=TaskResponse)
+@router.post("/send-email", response_model=TaskResponse, dependencies=enqueue_limits)
 async def send_email(
-    email_request: EmailRequest
+    email_request: EmailRequest,
+    request: Request,
+    cache_manager = Depends(get_cache_manager)
     # current_user: User = Depends(get_current_user)  # Временно отключено для тестирования
 ):
     """
-    Запуск фоновой задачи отправки email
+    Запуск фоновой задачи отправки email; повтор с тем же Idempotency-Key
+    возвращает уже поставленную задачу
     """
-    try:
-        # Запускаем задачу асинхронно
-        task = send_email_task.delay(
-            email_request.email,
-            email_request.subject,
-            email_request.message
-        )
-        
-        return TaskResponse(
+    from tasks import send_email_task  # celery грузим при первом вызове, а не при старте
+
+    # Ключи клиентов не должны пересекаться; пока маршрут без авторизации - область по IP
+    async with Idempotency(request, f"send_email:ip:{client_ip(request)}", email_request, cache_manager) as idem:
+        if idem.replay:
+            return idem.replay
+        try:
+            # Запускаем задачу асинхронно
+            task = send_email_task.delay(
+                email_request.email,
+                email_request.subject,
+                email_request.message
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Ошибка запуска задачи: {str(e)}")
+
+        result = TaskResponse(
             task_id=task.id,
             status="PENDING",
             message="Задача отправки email запущена"
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка запуска задачи: {str(e)}")
+        idem.store(result.model_dump())
+    return result
 
-@router.post("/process-data", response_model=TaskResponse)
+@router.post("/process-data", response_model=TaskResponse, dependencies=enqueue_limits)
 async def process_data(
     data_request: DataProcessRequest
     # current_user: User = Depends(get_current_user)  # Временно отключено для тестирования
@@ -53,6 +68,8 @@ async def process_data(
     """
     Запуск фоновой задачи обработки данных
     """
+    from tasks import process_data_task
+
     try:
         task = process_data_task.delay(data_request.data)
         
@@ -64,13 +81,15 @@ async def process_data(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка запуска задачи: {str(e)}")
 
-@router.post("/cleanup", response_model=TaskResponse)
+@router.post("/cleanup", response_model=TaskResponse, dependencies=enqueue_limits)
 async def cleanup(
     # current_user: User = Depends(get_current_user)  # Временно отключено для тестирования
 ):
     """
     Запуск задачи очистки
     """
+    from tasks import cleanup_task
+
     try:
         task = cleanup_task.delay()
         
@@ -89,8 +108,10 @@ async def get_task_status(task_id: str
     """
     Получение статуса задачи по ID
     """
+    from celery_app import celery_app
+
     try:
-        task_result = AsyncResult(task_id)
+        task_result = celery_app.AsyncResult(task_id)
         
         response = {
             "task_id": task_id,
@@ -1,11 +1,8 @@
-from fastapi import APIRouter
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
 from schemas.user import UserCreate, UserOut
-from models import User
-from utils import hash_password
-from auth import create_access_token
-from fastapi import Depends
+import crud
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -14,13 +11,9 @@ async def ping():
     return {"message": "pong"}
 
 @router.post("/register", response_model=UserOut)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.username == user.username).first()
-    if existing_user:
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    """Регистрация: хеш пароля вне event loop, дубликат ловит уникальный индекс"""
+    db_user = await crud.create_user(user, db)
+    if db_user is None:
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_pw = hash_password(user.password)
-    db_user = User(username=user.username, password=hashed_pw)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    return db_user
@@ -16,7 +16,16 @@ class NoteOut(BaseModel):
     id: int
     text: str
     created_at: datetime
+    updated_at: Optional[datetime] = None
+    version: int = 1
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
+
+class NoteStatsOut(BaseModel):
+    note_count: int = 0
+    last_modified: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -15,7 +15,7 @@ class UserOut(BaseModel):
     role: str
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class TokenData(BaseModel):
     username: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Переносит заметки из DATABASE_URL на шарды DATABASE_SHARD_URLS по
+database.shard_router - один раз перед включением шардирования на
+существующей базе (пока в основной БД есть заметки, приложение с шардами
+не стартует).
+
+Пачка сначала вставляется на шарды (id сохраняются, повтор не дублирует
+строки), потом удаляется из основной БД - прерванный запуск можно просто
+повторить. В конце на шардах пересчитываются note_stats перенесённых
+владельцев и сдвигаются последовательности id. На время переноса запись
+заметок должна быть остановлена.
+
+Запуск: python shard_backfill.py [--dry-run] [--batch 1000]
+"""
+import argparse
+import asyncio
+from collections import Counter, defaultdict
+from typing import Dict, Set
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+import database
+from models import Note, NoteStats
+
+notes = Note.__table__
+note_stats = NoteStats.__table__
+
+
+def _insert(conn):
+    """INSERT с ON CONFLICT для диалекта соединения"""
+    return sqlite.insert if conn.dialect.name == "sqlite" else postgresql.insert
+
+
+async def _plan() -> Dict[int, int]:
+    """Сколько заметок уедет на каждый шард"""
+    async with database.engine.connect() as conn:
+        rows = await conn.execute(select(notes.c.owner_id, func.count()).group_by(notes.c.owner_id))
+        plan = Counter()
+        for owner_id, count in rows:
+            plan[database.shard_for(owner_id)] += count
+    return dict(plan)
+
+
+async def _move_batch(batch: int, owners: Dict[int, Set[int]]) -> int:
+    async with database.engine.begin() as main_conn:
+        rows = (await main_conn.execute(select(notes).order_by(notes.c.id).limit(batch))).mappings().all()
+        if not rows:
+            return 0
+        by_shard = defaultdict(list)
+        for row in rows:
+            shard = database.shard_for(row["owner_id"])
+            by_shard[shard].append(dict(row))
+            owners[shard].add(row["owner_id"])
+        for shard, shard_rows in by_shard.items():
+            async with database.shard_engines[shard].begin() as conn:
+                await conn.execute(_insert(conn)(notes).values(shard_rows).on_conflict_do_nothing())
+        # Удаляем только после коммита на шардах: сбой между шагами оставит копию, а не потерю
+        await main_conn.execute(delete(notes).where(notes.c.id.in_([row["id"] for row in rows])))
+    return len(rows)
+
+
+async def _finish_shard(shard: int, shard_owners: Set[int]):
+    async with database.shard_engines[shard].begin() as conn:
+        counts = await conn.execute(
+            select(notes.c.owner_id, func.count(), func.max(func.coalesce(notes.c.updated_at, notes.c.created_at)))
+            .where(notes.c.owner_id.in_(shard_owners))
+            .group_by(notes.c.owner_id)
+        )
+        values = [
+            {"owner_id": owner_id, "note_count": count, "last_modified": last_modified}
+            for owner_id, count, last_modified in counts
+        ]
+        if values:
+            stmt = _insert(conn)(note_stats).values(values)
+            await conn.execute(stmt.on_conflict_do_update(
+                index_elements=[note_stats.c.owner_id],
+                set_={"note_count": stmt.excluded.note_count, "last_modified": stmt.excluded.last_modified},
+            ))
+        if conn.dialect.name == "postgresql":
+            # Новые заметки на шарде не должны получить id перенесённых
+            await conn.execute(text(
+                "SELECT setval(pg_get_serial_sequence('notes', 'id'), GREATEST((SELECT max(id) FROM notes), 1))"
+            ))
+
+
+async def backfill(dry_run: bool = False, batch: int = 1000) -> int:
+    await database.init_engine()
+    try:
+        if not database.shard_engines:
+            raise SystemExit("DATABASE_SHARD_URLS is empty - nothing to backfill")
+        plan = await _plan()
+        for shard, count in sorted(plan.items()):
+            print(f"{'would move' if dry_run else 'moving'} {count} notes to shard {shard}")
+        if dry_run:
+            return 0
+
+        owners: Dict[int, Set[int]] = defaultdict(set)
+        moved = 0
+        while True:
+            count = await _move_batch(batch, owners)
+            if not count:
+                break
+            moved += count
+            print(f"moved {moved} notes")
+        for shard, shard_owners in owners.items():
+            await _finish_shard(shard, shard_owners)
+        async with database.engine.begin() as conn:
+            # Счётчики в основной БД больше не читаются
+            await conn.execute(delete(note_stats))
+        return moved
+    finally:
+        await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move notes from DATABASE_URL to the shards")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(backfill(args.dry_run, args.batch))
@@ -2,7 +2,6 @@ import time
 import logging
 from celery_app import celery_app
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 @celery_app.task(bind=True)
@@ -10,12 +9,12 @@ def send_email_task(self, email: str, subject: str, message: str):
     """
     Имитация отправки email - длительная задача
     """
-    logger.info(f"Начинаю отправку email на {email}")
+    logger.info("Начинаю отправку email на %s", email)
     
 
     for i in range(10):
         time.sleep(1)  # Имитация работы
-        logger.info(f"Обработка email {i+1}/10")
+        logger.debug("Обработка email %d/10", i + 1)
         
         
         self.update_state(
@@ -25,7 +24,7 @@ def send_email_task(self, email: str, subject: str, message: str):
     
     
     time.sleep(2)
-    logger.info(f"Email успешно отправлен на {email}")
+    logger.info("Email успешно отправлен на %s", email)
     
     return {
         "status": "success",
@@ -40,7 +39,7 @@ def process_data_task(data: dict):
     """
     Пример другой длительной задачи для обработки данных
     """
-    logger.info(f"Начинаю обработку данных: {data}")
+    logger.info("Начинаю обработку данных: %s", data)
     
    
     time.sleep(5)
@@ -53,7 +52,7 @@ def process_data_task(data: dict):
         "items_count": len(data) if isinstance(data, dict) else 0
     }
     
-    logger.info(f"Данные обработаны: {processed_data}")
+    logger.info("Данные обработаны: %s", processed_data)
     return processed_data
 
 @celery_app.task
@@ -67,4 +66,27 @@ def cleanup_task():
     time.sleep(3)
     
     logger.info("Очистка завершена")
-    return {"status": "cleaned", "message": "Временные данные очищены"} 
\ No newline at end of file
+    return {"status": "cleaned", "message": "Временные данные очищены"}
+
+@celery_app.task
+def warm_cache_task(limit: int = None):
+    """
+    Прогрев кеша популярных заметок (после деплоя / failover Redis)
+    """
+    import asyncio
+    from cache_warmup import run_standalone
+
+    return asyncio.run(run_standalone(limit))
+
+@celery_app.task(bind=True)
+def import_notes_task(self, path: str, owner_id: int, fmt: str):
+    """
+    Импорт заметок из файла, сохранённого POST /notes/import (COPY через staging таблицу)
+    """
+    import asyncio
+    from bulk import run_import
+
+    def progress(meta: dict):
+        self.update_state(state="PROGRESS", meta=meta)
+
+    return asyncio.run(run_import(path, owner_id, fmt, progress))
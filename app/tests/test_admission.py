@@ -0,0 +1,40 @@
+import asyncio
+
+from admission import ConcurrencyLimitMiddleware
+
+
+async def slow_app(scope, receive, send):
+    await asyncio.sleep(0.1)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def run_requests(middleware, count, path="/notes/"):
+    statuses = []
+
+    async def call():
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+        await middleware({"type": "http", "path": path}, None, send)
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(count)))
+
+    asyncio.run(main())
+    return sorted(statuses)
+
+
+def test_sheds_load_over_limit_and_queue():
+    middleware = ConcurrencyLimitMiddleware(slow_app, limit=2, max_queue=1, queue_timeout_ms=20)
+    assert run_requests(middleware, 5) == [200, 200, 503, 503, 503]
+
+
+def test_queued_request_waits_for_slot():
+    middleware = ConcurrencyLimitMiddleware(slow_app, limit=1, max_queue=5, queue_timeout_ms=1000)
+    assert run_requests(middleware, 3) == [200, 200, 200]
+
+
+def test_exempt_paths_bypass_limit():
+    middleware = ConcurrencyLimitMiddleware(slow_app, limit=1, max_queue=0, queue_timeout_ms=10)
+    assert run_requests(middleware, 3, path="/health") == [200, 200, 200]
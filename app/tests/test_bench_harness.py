@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from benchmarks.harness import BenchResult, find_regressions, percentile, run_scenario, summarize
+
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 11)]
+    assert percentile(values, 50) == 5.0
+    assert percentile(values, 95) == 10.0
+    assert percentile([], 99) == 0.0
+
+
+def test_run_scenario_counts_errors():
+    async def op(i):
+        if i % 5 == 0:
+            raise RuntimeError("boom")
+
+    result = asyncio.run(run_scenario("op", op, requests=20, concurrency=4))
+    assert result.requests == 20
+    assert result.errors == 4
+
+
+def test_find_regressions():
+    baseline = {"op": vars(summarize("op", [0.010] * 100, 1.0, 1))}
+    slower = summarize("op", [0.020] * 100, 2.0, 1)
+    same = summarize("op", [0.010] * 100, 1.0, 1)
+    assert len(find_regressions([slower], baseline)) == 2
+    assert find_regressions([same], baseline) == []
+    assert find_regressions([BenchResult("new", 1, 1, 0, 1, 1, 1, 1, 1)], baseline) == []
+
+
+def test_external_targets_require_explicit_drop_flag():
+    from benchmarks.__main__ import parse_args
+
+    with pytest.raises(SystemExit):
+        parse_args(["--db-url", "postgresql+asyncpg://localhost/notes"])
+    with pytest.raises(SystemExit):
+        parse_args(["--redis-url", "redis://localhost"])
+    args = parse_args(["--db-url", "postgresql+asyncpg://localhost/bench", "--i-understand-this-drops-data"])
+    assert args.drop_data
+    assert not parse_args([]).drop_data
@@ -0,0 +1,81 @@
+import asyncio
+import os
+
+import pytest
+
+import bulk
+from config import settings
+
+
+def read_all(path, fmt):
+    reader = bulk._RecordReader(str(path), fmt)
+    try:
+        return [row for batch in reader.batches() for row in batch], reader.skipped
+    finally:
+        reader.close()
+
+
+def test_ndjson_skips_blank_invalid_and_textless_lines(tmp_path):
+    path = tmp_path / "notes.ndjson"
+    path.write_text('{"text": "a"}\n\n{"text": 1}\nnot json\n[]\n{"other": "x"}\n{"text": "b\\nc"}\n', encoding="utf-8")
+    rows, skipped = read_all(path, "ndjson")
+    assert rows == [("a",), ("b\nc",)]
+    assert skipped == 4
+
+
+def test_csv_reads_text_column_with_quoted_newlines(tmp_path):
+    path = tmp_path / "notes.csv"
+    path.write_text('id,text\n1,a\n2,"b, ""quoted""\nline"\n3\n', encoding="utf-8")
+    rows, skipped = read_all(path, "csv")
+    assert rows == [("a",), ('b, "quoted"\nline',)]
+    assert skipped == 1
+
+
+def test_csv_accepts_notes_longer_than_default_field_limit(tmp_path):
+    long_text = "x" * 200_000
+    path = tmp_path / "notes.csv"
+    path.write_text(f"text\n{long_text}\nshort\n", encoding="utf-8")
+    rows, skipped = read_all(path, "csv")
+    assert rows == [(long_text,), ("short",)]
+    assert skipped == 0
+
+
+def test_ndjson_skips_invalid_utf8_and_nul_rows(tmp_path):
+    path = tmp_path / "notes.ndjson"
+    path.write_bytes(
+        b'{"text": "a"}\n'
+        b'{"text": "bad \xff\xfe bytes"}\n'
+        b'{"text": "nul \\u0000 inside"}\n'
+        b'{"text": "lone \\ud800"}\n'
+        b'{"text": "b"}\n'
+    )
+    rows, skipped = read_all(path, "ndjson")
+    assert rows == [("a",), ("b",)]
+    assert skipped == 3
+
+
+def test_csv_skips_invalid_utf8_and_nul_rows(tmp_path):
+    path = tmp_path / "notes.csv"
+    path.write_bytes(b"text\na\nbad \xff\nnul \x00 inside\nb\n")
+    rows, skipped = read_all(path, "csv")
+    assert rows == [("a",), ("b",)]
+    assert skipped == 2
+
+
+def test_spool_upload_over_limit_raises_and_removes_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "IMPORT_SPOOL_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "IMPORT_MAX_BYTES", 10)
+
+    async def chunks(*parts):
+        for part in parts:
+            yield part
+
+    async def main():
+        path = await bulk.spool_upload(chunks(b"12345", b"678"), "csv")
+        with open(path, "rb") as f:
+            assert f.read() == b"12345678"
+        with pytest.raises(bulk.ImportTooLarge):
+            await bulk.spool_upload(chunks(b"123456", b"78901"), "csv")
+        assert sorted(p.name for p in tmp_path.iterdir()) == [os.path.basename(path)]
+
+    asyncio.run(main())
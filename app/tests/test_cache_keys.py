@@ -0,0 +1,13 @@
+from cache_keys import note_key, user_notes_key, parse_note_key, parse_user_notes_key
+
+
+def test_note_key_roundtrip():
+    assert parse_note_key(note_key(42, 7)) == (42, 7)
+    assert parse_note_key("note:x:user:7") is None
+    assert parse_note_key("user_notes:7:0:10:") is None
+
+
+def test_user_notes_key_roundtrip_keeps_colons_in_search():
+    key = user_notes_key(7, 20, 10, "a:b")
+    assert parse_user_notes_key(key) == (7, 20, 10, "a:b")
+    assert parse_user_notes_key(user_notes_key(7, 0, 10, None)) == (7, 0, 10, "")
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import cache_warmup
+import database
+from cache_keys import note_key, user_notes_index_key, user_notes_key
+from cache_warmup import HOT_KEYS_ZSET, WARMUP_LOCK, CountMinSketch, HotKeyTracker
+from models import Note, User
+from redis_client import CacheManager
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def make_manager():
+    return CacheManager(fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+
+def test_sketch_never_underestimates():
+    sketch = CountMinSketch(width=64, depth=4)
+    for i in range(200):
+        sketch.add(f"k{i % 20}")
+    assert all(sketch.add(f"k{i}", 0) >= 10 for i in range(20))
+
+
+def test_tracker_keeps_top_candidates_scaled_to_all_requests():
+    tracker = HotKeyTracker(sample_rate=1.0, capacity=2)
+    for key, hits in (("a", 10), ("b", 5), ("c", 1), ("d", 1), ("e", 1)):
+        for _ in range(hits):
+            tracker.record(key)
+    snapshot = tracker.drain()
+    assert snapshot["a"] >= 10 and snapshot["b"] >= 5
+    assert len(snapshot) <= 4
+    assert tracker.drain() == {}
+
+
+def test_decay_applied_once_per_interval_across_processes():
+    async def main():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        await redis.zadd(HOT_KEYS_ZSET, {"old": 100})
+        pods = [HotKeyTracker(sample_rate=1.0, capacity=10) for _ in range(3)]
+        for pod in pods:
+            pod.record("new")
+            await pod.flush(redis, decay=0.5, interval=60)
+        assert await redis.zscore(HOT_KEYS_ZSET, "old") == 50
+        assert await redis.zscore(HOT_KEYS_ZSET, "new") >= 3
+
+    asyncio.run(main())
+
+
+def test_warm_up_fills_missing_hot_keys(monkeypatch):
+    pytest.importorskip("aiosqlite")
+
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(database.Base.metadata.create_all)
+        monkeypatch.setattr(database, "AsyncSessionLocal", sessionmaker(bind=engine, class_=AsyncSession))
+        async with database.session_for_shard(None) as db:
+            db.add(User(id=1, username="u1", password="x"))
+            db.add_all([Note(id=i, text=f"note {i}", owner_id=1) for i in (1, 2)])
+            await db.commit()
+
+        manager = make_manager()
+        hot = {note_key(1, 1): 3, note_key(2, 1): 2, user_notes_key(1, 0, 10): 1}
+        await manager.redis.zadd(HOT_KEYS_ZSET, hot)
+        await manager.set(note_key(2, 1), {"cached": True})
+
+        stats = await cache_warmup.warm_up(manager, qps=1000)
+        assert stats == {"candidates": 3, "missing": 2, "warmed": 2}
+        assert (await manager.get(note_key(1, 1)))["text"] == "note 1"
+        assert await manager.get(note_key(2, 1)) == {"cached": True}
+        assert len(await manager.get(user_notes_key(1, 0, 10))) == 2
+        assert await manager.redis.sismember(user_notes_index_key(1), user_notes_key(1, 0, 10))
+        await engine.dispose()
+
+    asyncio.run(main())
+
+
+def test_warm_up_once_keeps_lock_taken_over_by_another_instance(monkeypatch):
+    pytest.importorskip("lupa")
+
+    async def main():
+        manager = make_manager()
+
+        async def quick_warm_up(cache_manager, **kwargs):
+            return {}
+
+        async def slow_warm_up(cache_manager, **kwargs):
+            # Наш TTL истёк, блокировку взял другой экземпляр
+            await cache_manager.redis.set(WARMUP_LOCK, "other")
+            return {}
+
+        monkeypatch.setattr(cache_warmup, "warm_up", slow_warm_up)
+        assert await cache_warmup.warm_up_once(manager) == {}
+        assert await manager.redis.get(WARMUP_LOCK) == "other"
+
+        await manager.redis.delete(WARMUP_LOCK)
+        monkeypatch.setattr(cache_warmup, "warm_up", quick_warm_up)
+        await cache_warmup.warm_up_once(manager)
+        assert await manager.redis.get(WARMUP_LOCK) is None
+
+    asyncio.run(main())
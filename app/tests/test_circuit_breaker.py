@@ -0,0 +1,43 @@
+from circuit_breaker import CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=5, clock=FakeClock())
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.metrics()["short_circuits_total"] == 1
+
+
+def test_half_open_probe_closes_or_reopens():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=5, clock=clock)
+    breaker.record_failure()
+    assert not breaker.try_probe()
+
+    clock.now = 5
+    assert breaker.try_probe()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.try_probe()  # вторая проба не выдаётся
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now = 10
+    assert breaker.try_probe()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
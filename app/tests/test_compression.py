@@ -0,0 +1,25 @@
+import gzip
+
+from compression import choose_encoding, compress, compressor, weak_etag
+
+
+def test_choose_encoding_uses_q_values_then_server_order():
+    assert choose_encoding("gzip;q=0.5, br;q=0.9", ["zstd", "br", "gzip"]) == "br"
+    assert choose_encoding("gzip, br", ["zstd", "br", "gzip"]) == "br"
+    assert choose_encoding("gzip;q=0, identity", ["gzip"]) is None
+    assert choose_encoding("*", ["gzip"]) == "gzip"
+    assert choose_encoding(None, ["gzip"]) is None
+
+
+def test_gzip_one_shot_and_streaming_roundtrip():
+    data = b'{"text": "note"}\n' * 1000
+    assert gzip.decompress(compress(data, "gzip")) == data
+    stream = compressor("gzip")
+    body = b"".join(stream.compress(data[i:i + 100]) for i in range(0, len(data), 100)) + stream.flush()
+    assert gzip.decompress(body) == data
+
+
+def test_weak_etag():
+    assert weak_etag('"l1.2"') == 'W/"l1.2"'
+    assert weak_etag('W/"l1.2"') == 'W/"l1.2"'
+    assert weak_etag(None) is None
@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+from etags import collection_etag, if_none_match, note_etag
+
+
+def request_with(header=None):
+    return SimpleNamespace(headers={"if-none-match": header} if header else {})
+
+
+def test_note_etag_changes_with_version():
+    assert note_etag(1, 1) != note_etag(1, 2)
+    assert note_etag(1, None) is None
+
+
+def test_collection_etag_depends_on_page():
+    assert collection_etag(1, 5, 0, 10) != collection_etag(1, 5, 10, 10)
+    assert collection_etag(1, 5, 0, 10) != collection_etag(1, 6, 0, 10)
+
+
+def test_if_none_match():
+    etag = note_etag(3, 4)
+    assert if_none_match(request_with(etag), etag)
+    assert if_none_match(request_with(f'"x", W/{etag}'), etag)
+    assert if_none_match(request_with("*"), etag)
+    assert not if_none_match(request_with('"other"'), etag)
+    assert not if_none_match(request_with(), etag)
+    assert not if_none_match(request_with(etag), None)
@@ -0,0 +1,135 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+import redis.asyncio as redis
+from fastapi import HTTPException
+
+from config import settings
+from idempotency import Idempotency
+from redis_client import CacheManager
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def make_manager():
+    return CacheManager(fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+
+def make_request(key="k1"):
+    return SimpleNamespace(headers={"Idempotency-Key": key})
+
+
+async def create(manager, body, calls):
+    async with Idempotency(make_request(), "notes:1", body, manager) as idem:
+        if idem.replay:
+            return idem.replay
+        calls.append(body)
+        idem.store({"id": len(calls)}, status_code=201)
+        return None
+
+
+def test_repeat_is_replayed_without_executing_again():
+    async def main():
+        manager, calls = make_manager(), []
+        assert await create(manager, {"text": "a"}, calls) is None
+        replay = await create(manager, {"text": "a"}, calls)
+        assert calls == [{"text": "a"}]
+        assert replay.status_code == 201
+        assert replay.body == b'{"id":1}'
+        assert replay.headers["Idempotent-Replayed"] == "true"
+
+    asyncio.run(main())
+
+
+def test_same_key_with_different_body_is_422():
+    async def main():
+        manager, calls = make_manager(), []
+        await create(manager, {"text": "a"}, calls)
+        with pytest.raises(HTTPException) as e:
+            await create(manager, {"text": "b"}, calls)
+        assert e.value.status_code == 422
+        assert calls == [{"text": "a"}]
+
+    asyncio.run(main())
+
+
+def test_duplicate_waits_for_pending_then_409(monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_WAIT_MS", 100)
+
+    async def main():
+        manager = make_manager()
+        release = asyncio.Event()
+
+        async def slow_first():
+            async with Idempotency(make_request(), "notes:1", {"text": "a"}, manager) as idem:
+                await release.wait()
+                idem.store({"id": 1})
+
+        first = asyncio.create_task(slow_first())
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as e:
+            await create(manager, {"text": "a"}, [])
+        assert e.value.status_code == 409
+        assert e.value.headers["Retry-After"] == "1"
+
+        # Дубликат, пришедший до завершения первого, дожидается его ответа
+        waiting = asyncio.create_task(create(manager, {"text": "a"}, []))
+        await asyncio.sleep(0.03)
+        release.set()
+        await first
+        replay = await waiting
+        assert replay.headers["Idempotent-Replayed"] == "true"
+
+    asyncio.run(main())
+
+
+def test_exception_releases_key():
+    async def main():
+        manager, calls = make_manager(), []
+        with pytest.raises(RuntimeError):
+            async with Idempotency(make_request(), "notes:1", {"text": "a"}, manager):
+                raise RuntimeError("db down")
+        assert await create(manager, {"text": "a"}, calls) is None
+        assert calls == [{"text": "a"}]
+
+    asyncio.run(main())
+
+
+def test_failed_store_releases_key():
+    async def main():
+        manager, calls = make_manager(), []
+        real_set = manager.redis.set
+
+        async def set_fails_for_done(key, value, **kwargs):
+            if '"done"' in value:
+                raise redis.ConnectionError("timeout")
+            return await real_set(key, value, **kwargs)
+
+        manager.redis.set = set_fails_for_done
+        await create(manager, {"text": "a"}, calls)
+        assert await manager.redis.get("idem:notes:1:k1") is None
+
+    asyncio.run(main())
+
+
+def test_task_keys_are_scoped_per_client(monkeypatch):
+    import tasks
+    from routers.tasks import EmailRequest, send_email
+
+    task_ids = iter(["task-1", "task-2", "task-3"])
+    monkeypatch.setattr(tasks.send_email_task, "delay", lambda *args: SimpleNamespace(id=next(task_ids)))
+
+    def client(host):
+        return SimpleNamespace(headers={"Idempotency-Key": "same"}, client=SimpleNamespace(host=host))
+
+    async def main():
+        manager = make_manager()
+        first = await send_email(EmailRequest(email="a@x", subject="s", message="m"), client("10.0.0.1"), manager)
+        # Тот же ключ у другого клиента с другим телом - не 422 и не чужой task_id
+        second = await send_email(EmailRequest(email="b@x", subject="s", message="m"), client("10.0.0.2"), manager)
+        assert (first.task_id, second.task_id) == ("task-1", "task-2")
+        replay = await send_email(EmailRequest(email="a@x", subject="s", message="m"), client("10.0.0.1"), manager)
+        assert b"task-1" in replay.body
+
+    asyncio.run(main())
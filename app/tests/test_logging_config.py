@@ -0,0 +1,33 @@
+import json
+import logging
+
+from logging_config import JsonFormatter, SamplingFilter, DeferredQueueHandler
+
+
+def make_record(msg="hello %s", args=("world",), **extra):
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_extra_fields():
+    line = JsonFormatter().format(make_record(event="cache_hit", key="note:1"))
+    payload = json.loads(line)
+    assert payload["msg"] == "hello world"
+    assert payload["level"] == "INFO"
+    assert payload["event"] == "cache_hit"
+    assert payload["key"] == "note:1"
+
+
+def test_sampling_filter_drops_and_keeps():
+    sampler = SamplingFilter({"cache_hit": 0.0, "cache_miss": 1.0})
+    assert sampler.filter(make_record(event="cache_hit")) is False
+    assert sampler.filter(make_record(event="cache_miss")) is True
+    assert sampler.filter(make_record()) is True
+
+
+def test_deferred_queue_handler_does_not_format():
+    record = make_record()
+    prepared = DeferredQueueHandler(None).prepare(record)
+    assert prepared.msg == "hello %s"
+    assert prepared.args == ("world",)
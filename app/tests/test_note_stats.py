@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import crud
+from database import Base
+from models import User
+from schemas.note import NoteCreate
+
+pytest.importorskip("aiosqlite")
+
+
+def test_stats_follow_create_and_delete():
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)() as db:
+            db.add(User(id=1, username="u1", password="x"))
+            await db.commit()
+            assert (await crud.get_note_stats(1, db)).note_count == 0
+
+            first = await crud.create_note(NoteCreate(text="a"), 1, db)
+            await crud.create_note(NoteCreate(text="b"), 1, db)
+            stats = await crud.get_note_stats(1, db)
+            assert stats.note_count == 2
+            assert stats.last_modified is not None
+
+            await crud.delete_note(first.id, 1, db)
+            await db.refresh(stats)
+            assert stats.note_count == 1
+            assert (await crud.get_note_stats(2, db)).note_count == 0
+        await engine.dispose()
+
+    asyncio.run(main())
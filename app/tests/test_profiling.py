@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import profiling
+from profiling import ProfilingMiddleware, RequestTimings, install_sqlalchemy_hooks
+
+
+def test_profile_header_requires_matching_secret():
+    middleware = ProfilingMiddleware(app=None, header_secret="s3cret")
+    allowed = lambda value: middleware._header_allowed(SimpleNamespace(headers={"X-Profile": value}))
+    assert allowed("s3cret")
+    assert not allowed("wrong")
+    assert not allowed("é")
+    assert not ProfilingMiddleware(app=None)._header_allowed(SimpleNamespace(headers={"X-Profile": ""}))
+
+
+def test_failed_query_does_not_skew_later_timings():
+    engine = create_engine("sqlite://")
+    install_sqlalchemy_hooks(engine)
+    timings = RequestTimings()
+    token = profiling._current.set(timings)
+    try:
+        with engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing_table"))
+            conn.execute(text("SELECT 1"))
+    finally:
+        profiling._current.reset(token)
+    assert timings.calls["db"] == 1
+    assert timings.seconds["db"] < 1
@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import rate_limit
+from config import settings
+from rate_limit import RateLimiter, RateLimitPolicy, client_ip, limit_by_user
+from redis_client import CacheManager
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # Lua скрипты в fakeredis
+
+
+def make_manager():
+    return CacheManager(fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+
+def test_policy_parse():
+    policy = RateLimitPolicy.parse("p", "120/60")
+    assert policy.capacity == 120
+    assert policy.refill_per_second == 2
+
+
+def test_bucket_refills_over_time():
+    async def main():
+        limiter = RateLimiter(make_manager())
+        policy = RateLimitPolicy.parse("p", "2/0.1")  # 20 токенов в секунду
+        assert (await limiter.check("rl:refill", policy)).allowed
+        assert (await limiter.check("rl:refill", policy)).allowed
+        rejected = await limiter.check("rl:refill", policy)
+        assert not rejected.allowed
+        assert rejected.retry_after_ms > 0
+        await asyncio.sleep(0.15)
+        assert (await limiter.check("rl:refill", policy)).allowed
+
+    asyncio.run(main())
+
+
+def test_burst_exhaustion_returns_429_with_retry_after():
+    async def main():
+        manager = make_manager()
+        dependency = limit_by_user(RateLimitPolicy.parse("notes", "3/60"))
+        user = SimpleNamespace(id=1)
+        for _ in range(3):
+            await dependency(request=None, current_user=user, cache_manager=manager)
+        with pytest.raises(HTTPException) as exc:
+            await dependency(request=None, current_user=user, cache_manager=manager)
+        assert exc.value.status_code == 429
+        assert int(exc.value.headers["Retry-After"]) >= 1
+        # Другой пользователь - свой bucket
+        await dependency(request=None, current_user=SimpleNamespace(id=2), cache_manager=manager)
+
+    asyncio.run(main())
+
+
+def test_fail_open_when_redis_is_down():
+    async def main():
+        manager = CacheManager(None)
+        dependency = limit_by_user(RateLimitPolicy.parse("notes", "1/60"))
+        for _ in range(5):
+            await dependency(request=None, current_user=SimpleNamespace(id=1), cache_manager=manager)
+
+        manager = make_manager()
+        for _ in range(manager.breaker.failure_threshold):
+            manager.breaker.record_failure()
+        result = await RateLimiter(manager).check("rl:down", RateLimitPolicy.parse("p", "1/60"))
+        assert result.allowed
+
+    asyncio.run(main())
+
+
+def test_client_ip_uses_entry_added_by_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(settings, "TRUST_FORWARDED_FOR", True)
+    monkeypatch.setattr(settings, "FORWARDED_TRUSTED_HOPS", 1)
+
+    def request(forwarded):
+        return SimpleNamespace(headers={"x-forwarded-for": forwarded}, client=SimpleNamespace(host="10.0.0.1"))
+
+    # Клиент подставляет что угодно слева - лимит всё равно на его реальный адрес
+    assert client_ip(request("1.1.1.1, 203.0.113.7")) == "203.0.113.7"
+    assert client_ip(request("2.2.2.2, 203.0.113.7")) == "203.0.113.7"
+    monkeypatch.setattr(settings, "FORWARDED_TRUSTED_HOPS", 2)
+    assert client_ip(request("1.1.1.1, 203.0.113.7, 10.0.0.2")) == "203.0.113.7"
+    assert client_ip(request("")) == "10.0.0.1"
+
+
+def test_limiter_is_reused_across_requests():
+    manager = make_manager()
+    assert rate_limit._get_limiter(manager) is rate_limit._get_limiter(manager)
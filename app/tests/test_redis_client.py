@@ -0,0 +1,122 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+import redis.asyncio as redis
+
+from cache_keys import user_notes_key
+from circuit_breaker import CLOSED
+from redis_client import CacheManager
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def make_manager():
+    return CacheManager(fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+
+def test_failed_bump_is_replayed_after_next_successful_operation():
+    async def main():
+        manager = make_manager()
+        await manager.bump_version("user_notes_ver:1")
+        before = int(await manager.redis.get("user_notes_ver:1"))
+
+        real_bump = manager._bump_version
+
+        async def failing_bump(key):
+            raise redis.ConnectionError("timeout")
+
+        manager._bump_version = failing_bump
+        assert await manager.bump_version("user_notes_ver:1") is None
+        manager._bump_version = real_bump
+        assert manager.breaker.state == CLOSED
+        assert manager._pending == {"user_notes_ver:1": "bump"}
+
+        await manager.get("anything")
+        await manager._replay_task
+        assert manager._pending == {}
+        assert int(await manager.redis.get("user_notes_ver:1")) > before
+
+    asyncio.run(main())
+
+
+def test_cancelled_probe_reopens_breaker():
+    async def main():
+        manager = make_manager()
+        manager.breaker.reset_timeout = 0
+        for _ in range(manager.breaker.failure_threshold):
+            manager.breaker.record_failure()
+
+        async def hanging_ping():
+            await asyncio.sleep(10)
+
+        manager.redis.ping = hanging_ping
+        probe = asyncio.create_task(manager.get("key"))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert manager.breaker.state == "open"
+        assert manager.breaker.try_probe()
+
+    asyncio.run(main())
+
+
+def test_delete_index_removes_only_indexed_keys():
+    pytest.importorskip("lupa")
+
+    async def main():
+        manager = make_manager()
+        await manager.set("user_notes:1:0:20:", [1], index="user_notes:1:keys")
+        await manager.set_many({"user_notes:1:20:20:": [2]}, indexes={"user_notes:1:20:20:": "user_notes:1:keys"})
+        await manager.set("user_notes:2:0:20:", [3], index="user_notes:2:keys")
+
+        assert await manager.delete_index("user_notes:1:keys")
+        assert await manager.redis.keys("user_notes:1:*") == []
+        assert await manager.get("user_notes:2:0:20:") == [3]
+
+    asyncio.run(main())
+
+
+def test_search_suffix_cannot_reach_compressed_variants():
+    async def main():
+        server = fakeredis.FakeServer()
+        manager = CacheManager(
+            fakeredis.aioredis.FakeRedis(server=server, decode_responses=True),
+            fakeredis.aioredis.FakeRedis(server=server),
+        )
+        page = [{"text": "x" * 2000}]
+        await manager.set(user_notes_key(1, 0, 20, "foo"), page, precompress=True)
+        await manager.set(user_notes_key(1, 0, 20, "bar|gzip"), [{"text": "plain"}])
+
+        # search=foo|gzip не читает gzip байты страницы foo через decode_responses клиент
+        assert await manager.get_variant(user_notes_key(1, 0, 20, "foo|gzip"), "gzip") == (None, None)
+        # и JSON страницы bar|gzip не отдаётся как gzip вариант страницы bar
+        assert await manager.get_variant(user_notes_key(1, 0, 20, "bar"), "gzip") == (None, None)
+        body, _ = await manager.get_variant(user_notes_key(1, 0, 20, "foo"), "gzip")
+        assert gzip.decompress(body) == json.dumps(page).encode()
+        assert manager.breaker.state == CLOSED
+
+    asyncio.run(main())
+
+
+def test_data_errors_do_not_open_breaker():
+    async def main():
+        manager = make_manager()
+
+        async def bad_data():
+            raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+        async def outage():
+            raise redis.ConnectionError("refused")
+
+        for _ in range(manager.breaker.failure_threshold * 2):
+            assert await manager.run("get", bad_data, "default") == "default"
+        assert manager.breaker.state == CLOSED
+
+        for _ in range(manager.breaker.failure_threshold):
+            await manager.run("get", outage)
+        assert manager.breaker.state == "open"
+
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import database
+import shard_backfill
+from config import settings
+from models import Note, NoteStats, User
+
+pytest.importorskip("aiosqlite")
+
+
+def test_backfill_moves_notes_to_owner_shards(tmp_path, monkeypatch):
+    urls = [f"sqlite+aiosqlite:///{tmp_path / name}.db" for name in ("main", "shard0", "shard1")]
+    monkeypatch.setattr(settings, "DATABASE_URL", urls[0])
+    monkeypatch.setattr(settings, "DATABASE_SHARD_URLS", urls[1:])
+    monkeypatch.setattr(settings, "DB_POOL_WARMUP", 0)
+    monkeypatch.setattr(database, "shard_router", None)
+
+    async def count(url, table, **where):
+        engine = create_async_engine(url)
+        async with engine.connect() as conn:
+            query = select(func.count()).select_from(table)
+            for column, value in where.items():
+                query = query.where(table.c[column] == value)
+            result = (await conn.execute(query)).scalar()
+        await engine.dispose()
+        return result
+
+    async def main():
+        for url in urls:
+            engine = create_async_engine(url)
+            async with engine.begin() as conn:
+                await conn.run_sync(database.Base.metadata.create_all)
+                if url == urls[0]:
+                    await conn.execute(User.__table__.insert(), [
+                        {"id": 1, "username": "u1", "password": "x"},
+                        {"id": 2, "username": "u2", "password": "x"},
+                    ])
+                    await conn.execute(Note.__table__.insert(), [
+                        {"id": i, "text": f"note {i}", "owner_id": 1 + i % 2} for i in range(1, 8)
+                    ])
+            await engine.dispose()
+
+        # Шарды включены, а заметки ещё в основной БД - приложение не должно стартовать
+        await database.init_engine()
+        with pytest.raises(RuntimeError):
+            await database.ensure_no_unsharded_notes()
+        await database.dispose_engine()
+
+        assert await shard_backfill.backfill(batch=3) == 7
+        assert await count(urls[0], Note.__table__) == 0
+        # owner_id % 2: владелец 2 на шарде 0, владелец 1 на шарде 1
+        assert await count(urls[1], Note.__table__, owner_id=2) == 4
+        assert await count(urls[2], Note.__table__, owner_id=1) == 3
+        assert await count(urls[1], NoteStats.__table__, owner_id=2, note_count=4) == 1
+
+        await database.init_engine()
+        await database.ensure_no_unsharded_notes()
+        await database.dispose_engine()
+
+    asyncio.run(main())